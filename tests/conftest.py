@@ -0,0 +1,155 @@
+import faulthandler
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# Keep the logs of the test run out of the source tree. Set before themeswitch is imported, since importing it
+# already logs, and inherited by the interpreters the tests start.
+os.environ["THEMESWITCH_LOG_DIR"] = tempfile.mkdtemp(prefix="themeswitch-test-logs-")
+
+from themeswitch import functions  # noqa: E402
+from themeswitch.backend import FakeBackend
+from themeswitch.metrics import percentile
+
+# Seconds per operation, roughly what the real calls cost on a desktop. Used by the benchmarks so that the
+# structure of a switch (what runs, how often, in what order) shows up in the numbers.
+WINDOWS_LATENCY = {
+    'read_theme': 0.0005,
+    'write_theme': 0.001,
+    'write_themes': 0.001,
+    'get_brightness': 0.004,
+    'set_brightness': 0.008,
+    'get_wallpaper': 0.0005,
+    'set_wallpaper': 0.005,
+    'run_command': 0.003,
+}
+
+TEST_TIMEOUT = 120  # Seconds before a hanging test dumps every thread's stack and ends the run
+
+_results = []
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "bench: latency benchmark, reported in the terminal summary")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("latency")
+    terminalreporter.write_line(f"{'name':<32}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, runs, p50, p95, worst in _results:
+        terminalreporter.write_line(f"{name:<32}{runs:>6}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}{worst * 1000:>10.2f}")
+
+
+class Latency:
+    def measure(self, name, func, runs=30, setup=None):
+        """
+        Call ``func`` ``runs`` times and record its p50/p95/max latency for the terminal summary
+
+        :param name: Label used in the report
+        :type name: str
+        :param func: Callable to measure
+        :type func: callable
+        :param runs: Number of timed calls
+        :type runs: int
+        :param setup: Optional callable run untimed before every call
+        :type setup: callable
+        :return: ``(p50, p95, max)`` in seconds
+        :rtype: tuple
+        """
+        samples = []
+        for _ in range(runs):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        stats = (percentile(samples, 50), percentile(samples, 95), max(samples))
+        _results.append((name, runs) + stats)
+        return stats
+
+
+@pytest.fixture(autouse=True)
+def test_timeout():
+    faulthandler.dump_traceback_later(TEST_TIMEOUT, exit=True)
+    yield
+    faulthandler.cancel_dump_traceback_later()
+
+
+@pytest.fixture
+def latency():
+    return Latency()
+
+
+@pytest.fixture
+def backend():
+    fake = FakeBackend()
+    previous = functions.set_backend(fake)
+    yield fake
+    functions.set_backend(previous)
+
+
+@pytest.fixture
+def slow_backend(backend):
+    backend.latency = dict(WINDOWS_LATENCY)
+    return backend
+
+
+@pytest.fixture(autouse=True)
+def metrics_file(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.log"
+    monkeypatch.setattr(functions, "METRICS_FILE", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def solar_cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "solar"
+    monkeypatch.setattr(functions, "SOLAR_CACHE_DIR", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def wallpaper_cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "wallpapers"
+    monkeypatch.setattr(functions, "WALLPAPER_CACHE_DIR", path)
+    return path
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    path = tmp_path / "settings.yaml"
+    monkeypatch.setattr(functions, "SETTINGS_FILE", path)
+    return path
+
+
+@pytest.fixture
+def settings(settings_file):
+    return functions.load_settings()
+
+
+@pytest.fixture
+def instance_address(tmp_path, monkeypatch):
+    if sys.platform == 'win32':
+        address = r'\\.\pipe\themeswitch-test-{0}-{1}'.format(os.getpid(), tmp_path.name)
+    else:
+        address = str(tmp_path / "instance.sock")
+    monkeypatch.setattr(functions, "INSTANCE_ADDRESS", address)
+    return address
+
+
+@pytest.fixture
+def tk_root():
+    tk = pytest.importorskip("tkinter")
+    pytest.importorskip("PIL.ImageTk")
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        pytest.skip(f"No display available: {e}")
+    root.withdraw()
+    yield root
+    root.destroy()
@@ -0,0 +1,56 @@
+import pytest
+
+from themeswitch import functions, instance
+
+pytestmark = pytest.mark.bench
+
+
+def test_switch_latency(slow_backend, settings, latency):
+    settings['dark_mode']['wallpaper'] = "C:\\dark.jpg"
+    settings['light_mode']['wallpaper'] = "C:\\light.jpg"
+    modes = iter(['dark_mode', 'light_mode'] * 30)
+    p50, p95, _ = latency.measure("switch", lambda: functions.change_sys_theme(**settings[next(modes)]))
+    # Reads and steps run concurrently: a switch should cost about as much as the slowest read plus the slowest step,
+    # not the sum of all of them
+    sequential = sum(slow_backend.latency[op] for op in ('get_brightness', 'get_wallpaper', 'set_brightness',
+                                                         'set_wallpaper', 'write_themes')) + \
+        2 * slow_backend.latency['read_theme']
+    assert p50 < sequential
+    assert p95 < 0.2
+
+
+def test_noop_switch_latency(slow_backend, settings, latency):
+    values = dict(settings['dark_mode'], wallpaper="C:\\dark.jpg")
+    functions.change_sys_theme(**values)
+    p50, p95, _ = latency.measure("switch (already set)", lambda: functions.change_sys_theme(**values))
+    assert slow_backend.count('set_wallpaper') == 1
+    assert p95 < 0.2
+
+
+def test_startup_latency(slow_backend, settings, latency):
+    for mode in ('dark_mode', 'light_mode'):
+        settings[mode]['enable_schedule'] = True
+    functions.check_tasks(settings)
+
+    def startup():
+        functions.check_tasks(functions.load_settings())
+
+    p50, p95, _ = latency.measure("startup", startup)
+    assert p95 < 0.3
+
+
+def test_check_tasks_latency(slow_backend, settings, latency):
+    for mode in ('dark_mode', 'light_mode'):
+        settings[mode]['enable_schedule'] = True
+    functions.check_tasks(settings)
+    p50, p95, _ = latency.measure("check_tasks", lambda: functions.check_tasks(settings))
+    assert p95 < 0.2
+
+
+def test_forward_latency(instance_address, latency):
+    server = instance.acquire(instance_address, lambda command, options: None)
+    try:
+        p50, p95, _ = latency.measure("forward (round trip)", lambda: instance.forward(instance_address, "toggle"))
+    finally:
+        server.close()
+    assert p95 < 0.05
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from themeswitch.brightness import BrightnessController, BrightnessPreview, FakeComError, FakeWmiProvider
+
+
+@pytest.fixture
+def provider():
+    return FakeWmiProvider(connect_latency=0.02)
+
+
+@pytest.fixture
+def controller(provider):
+    controller = BrightnessController(provider, stale_errors=(FakeComError,))
+    yield controller
+    controller.close()
+
+
+def test_connects_once(provider, controller):
+    for value in (10, 20, 30):
+        controller.set(value)
+    assert controller.get() == 30
+    assert provider.connects == 1
+    assert provider.set_calls == 3
+
+
+def test_reconnects_when_session_goes_stale(provider, controller):
+    controller.set(10)
+    provider.expire()
+    controller.set(50)
+    assert provider.brightness == 50
+    assert provider.connects == 2
+
+
+def test_unrelated_errors_are_raised(provider):
+    controller = BrightnessController(provider, stale_errors=(KeyError,))
+    try:
+        controller.set(10)
+        provider.expire()
+        with pytest.raises(FakeComError):
+            controller.set(20)
+    finally:
+        controller.close()
+
+
+@pytest.mark.bench
+def test_cached_brightness_latency(provider, controller, latency):
+    controller.set(0)
+    p50, p95, _ = latency.measure("brightness (cached session)", lambda: controller.set(50))
+    assert p95 < provider.connect_latency
+
+
+@pytest.fixture
+def preview(slow_backend):
+    preview = BrightnessPreview(slow_backend.set_brightness, slow_backend.get_brightness, min_interval=0.05)
+    yield preview
+    preview.cancel()
+    preview.join(2)
+
+
+def test_preview_sends_only_the_latest_level(slow_backend, preview):
+    start = time.perf_counter()
+    for value in range(0, 101):
+        preview.show(value / 2)
+        time.sleep(0.001)
+    assert time.perf_counter() - start < 0.5  # Dragging never waits for WMI
+    preview.commit()
+    preview.join(2)
+    assert preview.sent[-1] == 50
+    assert len(preview.sent) < 101 / 5
+    assert slow_backend.brightness == 50
+
+
+def test_preview_rate_is_capped(slow_backend, preview):
+    times = []
+    set_brightness = slow_backend.set_brightness
+    slow_backend.set_brightness = lambda value: (times.append(time.monotonic()), set_brightness(value))
+    deadline = time.monotonic() + 0.3
+    value = 0
+    while time.monotonic() < deadline:
+        preview.show(value % 100)
+        value += 1
+    preview.commit()
+    preview.join(2)
+    assert all(b - a >= preview.min_interval * 0.9 for a, b in zip(times, times[1:]))
+
+
+def test_cancel_restores_original_level(slow_backend, preview):
+    slow_backend.brightness = 70
+    for value in (10, 20, 30):
+        preview.show(value)
+    time.sleep(0.1)
+    preview.cancel()
+    preview.join(2)
+    assert preview.original == 70
+    assert slow_backend.brightness == 70
+    preview.show(5)  # Finished previews ignore new levels
+    assert slow_backend.brightness == 70
@@ -0,0 +1,33 @@
+import threading
+
+from themeswitch.dispatch import Dispatcher
+
+
+class FakeWidget:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, func):
+        self.scheduled.append((ms, func))
+
+
+def test_posted_calls_run_on_the_polling_thread():
+    dispatcher = Dispatcher(interval=10)
+    ran_on = []
+    thread = threading.Thread(target=dispatcher.post, args=(lambda: ran_on.append(threading.current_thread()),))
+    thread.start()
+    thread.join()
+    assert ran_on == []
+    widget = FakeWidget()
+    dispatcher.start(widget)
+    assert ran_on == [threading.current_thread()]
+    assert widget.scheduled == [(10, dispatcher._poll)]
+
+
+def test_failing_call_does_not_stop_the_queue():
+    dispatcher = Dispatcher()
+    ran = []
+    dispatcher.post(lambda: 1 / 0)
+    dispatcher.post(ran.append, 1)
+    dispatcher.run_pending()
+    assert ran == [1]
@@ -0,0 +1,103 @@
+import time
+
+import yaml
+
+from themeswitch import functions
+from themeswitch.backend import APPS_THEME, SYSTEM_THEME
+
+
+def test_load_settings_creates_defaults(settings_file):
+    settings = functions.load_settings()
+    assert yaml.safe_load(settings_file.read_text()) == settings
+    assert functions.check_settings(yaml.safe_load(settings_file.read_text()))
+
+
+def test_load_settings_replaces_corrupted_file(settings_file):
+    settings_file.write_text("dark_mode: 3\n")
+    functions.load_settings()
+    assert functions.check_settings(yaml.safe_load(settings_file.read_text()))
+
+
+def test_change_sys_theme(backend):
+    functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    assert backend.brightness == 40
+    assert backend.wallpaper == "C:\\dark.jpg"
+    assert backend.themes == {APPS_THEME: 0, SYSTEM_THEME: 0}
+    assert not functions.light_mode_is_on()
+
+
+def test_check_tasks_creates_missing_task(backend, settings):
+    settings['dark_mode']['enable_schedule'] = True
+    functions.check_tasks(settings)
+    task = backend.scheduler.tasks['change to dark mode']
+    assert task['start_time'] == "07:00" and task['enabled']
+    assert 'change to light mode' not in backend.scheduler.tasks
+
+
+def test_check_tasks_corrects_state_and_time(backend, settings):
+    backend.scheduler.add("Change to Dark Mode", "08:30", enabled=False)
+    backend.scheduler.add("Change to Light Mode", "19:00", enabled=True)
+    settings['dark_mode']['enable_schedule'] = True
+    functions.check_tasks(settings)
+    assert backend.scheduler.tasks['change to dark mode'] == {'name': "Change to Dark Mode", 'start_time': "07:00",
+                                                             'enabled': True}
+    assert not backend.scheduler.tasks['change to light mode']['enabled']
+
+
+def test_failed_step_does_not_stop_the_others(backend):
+    backend.errors['set_brightness'] = OSError("WMI unavailable")
+    result = functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    assert not result.ok
+    assert [step.name for step in result.failed] == ['brightness']
+    assert backend.wallpaper == "C:\\dark.jpg"
+    assert backend.themes == {APPS_THEME: 0, SYSTEM_THEME: 0}
+
+
+def test_slow_step_times_out(backend):
+    backend.latency = {'set_wallpaper': 0.2}
+    result = functions.change_sys_theme(40, "C:\\dark.jpg", 0, timeout=0.02)
+    assert result.duration < 0.2
+    assert [step.name for step in result.failed] == ['wallpaper']
+    assert isinstance(result.failed[0].error, TimeoutError)
+    time.sleep(0.2)  # Let the timed out step finish before the test ends
+
+
+def test_switch_skips_values_already_set(backend):
+    functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    writes = len(backend.calls)
+    result = functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    assert result.steps == []
+    assert result.skipped == ['brightness', 'wallpaper', 'apps_theme', 'system_theme']
+    assert all(call[0] in ('get_brightness', 'get_wallpaper', 'read_theme', 'get_screen_size') for call in backend.calls[writes:])
+
+
+def test_switch_runs_only_changed_steps(backend):
+    backend.themes = {APPS_THEME: 0, SYSTEM_THEME: 1}
+    backend.wallpaper = "C:\\dark.jpg"
+    result = functions.change_sys_theme(100, "C:\\dark.jpg", 0)
+    assert [step.name for step in result.steps] == ['theme']
+    assert result.skipped == ['brightness', 'wallpaper', 'apps_theme']
+    assert backend.calls[-1] == ('write_themes', {SYSTEM_THEME: 0})
+
+
+def test_forced_switch_runs_every_step(backend):
+    functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    result = functions.change_sys_theme(40, "C:\\dark.jpg", 0, force=True)
+    assert [step.name for step in result.steps] == ['brightness', 'wallpaper', 'theme'] and result.skipped == []
+
+
+def test_unreadable_value_is_set(backend):
+    functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    backend.errors['get_brightness'] = OSError("WMI unavailable")
+    result = functions.change_sys_theme(40, "C:\\dark.jpg", 0)
+    assert [step.name for step in result.steps] == ['brightness']
+
+
+def test_failed_wallpaper_preparation_does_not_stop_the_switch(backend, monkeypatch):
+    def fail(source, size):
+        raise ValueError("image too large")
+    monkeypatch.setattr(functions.get_wallpaper_cache(), "prepare", fail)
+    result = functions.change_sys_theme(50, "C:\\dark.jpg", 0)
+    assert result.ok
+    assert backend.wallpaper == "C:\\dark.jpg"
+    assert backend.brightness == 50
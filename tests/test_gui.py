@@ -0,0 +1,132 @@
+import tracemalloc
+
+import pytest
+
+from themeswitch import assets
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_icons_are_decoded_once():
+    assert assets.image("moon.png") is assets.image("moon.png")
+
+
+def test_photos_are_shared_per_interpreter(tk_root):
+    import tkinter as tk
+    window = tk.Toplevel(tk_root)
+    assert assets.photo(window, "sun.png") is assets.photo(tk_root, "sun.png")
+
+
+def test_toggling_does_not_leak(tk_root, backend, settings):
+    from themeswitch import gui
+
+    window = gui.MainWindow(tk_root)
+    items = len(window.canvas.find_all())
+    window.apply_dark_theme()
+    window.apply_light_theme()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(2000):
+        window.apply_dark_theme()
+        window.apply_light_theme()
+    growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+    assert len(window.canvas.find_all()) == items
+    assert growth < 256 * 1024
+
+
+def test_only_the_active_theme_is_loaded(tk_root, backend, settings):
+    from themeswitch import gui
+
+    backend.themes = {name: 0 for name in backend.themes}
+    window = gui.MainWindow(tk_root)
+    assert tk_root.tk.call("package", "provide", "awdark") != ""
+    assert tk_root.tk.call("package", "provide", "awlight") == ""
+    window.apply_light_theme()
+    assert tk_root.tk.call("package", "provide", "awlight") != ""
+
+
+@pytest.mark.bench
+def test_tk_startup_latency(tk_root, backend, settings, latency):
+    import tkinter as tk
+    from themeswitch import gui
+
+    window = gui.MainWindow(tk_root)
+
+    def main_window():
+        root = tk.Tk()
+        root.withdraw()
+        gui.MainWindow(root)
+        root.update_idletasks()
+        root.destroy()
+
+    def settings_dialog():
+        toplevel = tk.Toplevel(tk_root)
+        gui.Settings(toplevel, 'dark_mode')
+        toplevel.update_idletasks()
+        toplevel.destroy()
+
+    latency.measure("tk startup: main window", main_window, runs=10)
+    p50, p95, _ = latency.measure("tk startup: settings dialog", settings_dialog, runs=10)
+    assert window and p95 < 0.5
+
+
+def test_settings_are_saved_only_on_apply(tk_root, backend, settings, monkeypatch):
+    import tkinter as tk
+    from themeswitch import functions, gui
+    monkeypatch.setattr(gui.messagebox, "showinfo", lambda *args, **kwargs: None)
+    toplevel = tk.Toplevel(tk_root)
+    dialog = gui.Settings(toplevel, 'dark_mode')
+    dialog.brightness_scale[0].set(35)
+    dialog.enable_scheduler[0].set(True)
+    dialog.close()
+    assert functions.load_settings() == settings  # Closed without Apply
+    assert backend.calls == []
+
+    toplevel = tk.Toplevel(tk_root)
+    dialog = gui.Settings(toplevel, 'dark_mode')
+    dialog.brightness_scale[0].set(35)
+    dialog.enable_scheduler[0].set(True)
+    dialog.apply_changes()
+    dialog.close()
+    assert functions.load_settings()['dark_mode']['brightness'] == 35
+    assert "change to dark mode" in backend.scheduler.tasks
+
+
+def test_brightness_preview_is_restored_on_close(tk_root, slow_backend, settings):
+    import tkinter as tk
+    from themeswitch import gui
+
+    slow_backend.brightness = 80
+    toplevel = tk.Toplevel(tk_root)
+    dialog = gui.Settings(toplevel, 'dark_mode')
+    dialog.live_preview.set(True)
+    for value in range(0, 40):
+        dialog.whole_values_only(0, value + 0.4)
+    assert dialog.brightness_scale[0].get() == 39
+    preview = dialog.preview
+    dialog.close()
+    preview.join(2)
+    assert slow_backend.brightness == 80
+    assert len(preview.sent) < 40
+
+
+def test_switch_runs_off_the_tk_thread(tk_root, slow_backend, settings):
+    import time
+    from themeswitch import gui
+    from themeswitch.backend import APPS_THEME
+
+    slow_backend.themes = {name: 1 for name in slow_backend.themes}
+    window = gui.MainWindow(tk_root)
+    start = time.perf_counter()
+    window.change_system_mode()
+    assert time.perf_counter() - start < 0.05
+    assert str(window.action_btn.cget("state")) == "disabled"
+    assert window.action_btn.cget("text") == "Switching…"
+    deadline = time.monotonic() + 5
+    while str(window.action_btn.cget("state")) == "disabled" and time.monotonic() < deadline:
+        tk_root.update()
+        time.sleep(0.01)
+    assert str(window.action_btn.cget("state")) == "normal"
+    assert slow_backend.themes[APPS_THEME] == 0
+    assert window.action_btn.cget("text") == "Dark mode on"
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+from multiprocessing.connection import Client
+
+import pytest
+
+from themeswitch import functions, instance
+from themeswitch.__main__ import handle_command, main, parse_command
+from themeswitch.scheduler import Scheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.commands = []
+        self.received = threading.Event()
+
+    def __call__(self, command, options):
+        self.commands.append((command, options))
+        self.received.set()
+
+
+@pytest.fixture
+def server(instance_address):
+    recorder = Recorder()
+    server = instance.acquire(instance_address, recorder)
+    server.recorder = recorder
+    yield server
+    server.close()
+
+
+def test_forward_without_instance(instance_address):
+    assert instance.forward(instance_address, "dark") is None
+
+
+def test_forward_to_running_instance(server, instance_address):
+    assert instance.forward(instance_address, "dark --force") == instance.OK
+    assert server.recorder.commands == [('dark', ['--force'])]
+
+
+def test_second_instance_is_refused(server, instance_address):
+    assert instance.acquire(instance_address, Recorder()) is None
+
+
+def test_unknown_command(server, instance_address):
+    assert instance.forward(instance_address, "format-disk").startswith("error")
+    assert instance.forward(instance_address, "").startswith("error")
+    assert server.recorder.commands == []
+
+
+def test_handler_error_is_reported(instance_address):
+    def fail(command, options):
+        raise RuntimeError("boom")
+    server = instance.acquire(instance_address, fail)
+    try:
+        assert instance.forward(instance_address, "open") == "error: boom"
+    finally:
+        server.close()
+
+
+def test_forward_times_out(instance_address):
+    release = threading.Event()
+    server = instance.acquire(instance_address, lambda command, options: release.wait(5) and None)
+    try:
+        assert instance.forward(instance_address, "dark", timeout=0.1) is None
+    finally:
+        release.set()
+        server.close()
+
+
+def test_silent_client_does_not_block_server(server, instance_address, monkeypatch):
+    monkeypatch.setattr(instance, "TIMEOUT", 0.1)
+    silent = Client(instance_address)
+    try:
+        assert instance.forward(instance_address, "toggle") == instance.OK
+    finally:
+        silent.close()
+
+
+def test_close_is_immediate_between_connections(instance_address):
+    for _ in range(20):
+        server = instance.acquire(instance_address, Recorder())
+        instance.forward(instance_address, "toggle")
+        server.close()
+
+
+def test_close_releases_lock(instance_address):
+    instance.acquire(instance_address, Recorder()).close()
+    assert instance.forward(instance_address, "dark") is None
+    server = instance.acquire(instance_address, Recorder())
+    assert server is not None
+    server.close()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Named pipes disappear with their process")
+def test_stale_socket_is_replaced(instance_address):
+    with open(instance_address, "w"):
+        pass
+    server = instance.acquire(instance_address, Recorder())
+    assert server is not None
+    assert instance.forward(instance_address, "toggle") == instance.OK
+    server.close()
+    assert not os.path.exists(instance_address)
+
+
+@pytest.mark.parametrize("argv, expected", [
+    ([], ('open', [])),
+    (['-d'], ('dark', [])),
+    (['-l', '-f'], ('light', ['--force'])),
+    (['-f'], ('open', [])),
+    (['--toggle'], ('toggle', [])),
+    (['-t', '-f'], ('toggle', ['--force'])),
+    (['-d', '--scheduled'], ('dark', ['--scheduled'])),
+    (['--reload-settings'], ('reload-settings', [])),
+])
+def test_parse_command(argv, expected):
+    assert parse_command(argv) == expected
+
+
+def test_main_forwards_to_running_instance(server, backend, settings_file):
+    main(['-d', '-f'])
+    assert server.recorder.commands == [('dark', ['--force'])]
+    assert backend.calls == []
+    assert not settings_file.exists()  # Forwarding doesn't even load the settings
+
+
+def test_scheduled_task_defers_to_running_scheduler(backend, settings, monkeypatch):
+    scheduler = Scheduler(lambda mode: None)
+    monkeypatch.setattr(functions, "_scheduler", scheduler)
+    settings['dark_mode']['enable_schedule'] = True
+    scheduler.update(settings)
+    scheduler.start()
+    try:
+        reply = handle_command('dark', ['--scheduled'], show_window=None)
+    finally:
+        scheduler.stop()
+    assert reply.startswith("skipped")
+    assert backend.calls == []
+
@@ -0,0 +1,73 @@
+import logging
+from logging.handlers import QueueHandler
+
+import pytest
+
+from themeswitch import functions
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    previous = functions.log_file().parent
+    functions.setup_logging(tmp_path, max_bytes=2048, backup_count=2, rotate=True)
+    yield tmp_path
+    functions.setup_logging(previous)
+
+
+def test_setup_is_idempotent(log_dir):
+    for _ in range(5):
+        functions.get_logger("themeswitch.test")
+        functions.setup_logging(log_dir)
+    handlers = logging.getLogger("themeswitch").handlers
+    assert len([handler for handler in handlers if isinstance(handler, QueueHandler)]) == 1
+    assert functions.get_logger("themeswitch.test").handlers == []
+
+
+def test_records_are_written_once(log_dir):
+    logger = functions.get_logger("themeswitch.test")
+    logger.info("switched")
+    logger.error("failed")
+    functions.flush_logs()
+    full = (log_dir / "full.log").read_text()
+    assert full.count("switched") == 1 and full.count("failed") == 1
+    assert "switched" not in (log_dir / "app.log").read_text()
+
+
+def test_outside_loggers_are_kept(log_dir):
+    functions.get_logger("__main__").info("from main")
+    functions.flush_logs()
+    assert "themeswitch.__main__ - INFO - from main" in (log_dir / "full.log").read_text()
+
+
+def test_logs_are_rotated(log_dir):
+    logger = functions.get_logger("themeswitch.test")
+    for i in range(200):
+        logger.info("line %s", i)
+    functions.flush_logs()
+    assert sorted(p.name for p in log_dir.glob("full.log*")) == ["full.log", "full.log.1", "full.log.2"]
+    assert (log_dir / "full.log").stat().st_size <= 2048
+
+
+def test_failed_rotation_keeps_appending(log_dir, monkeypatch):
+    def locked(source, target):
+        raise PermissionError("The file is being used by another process")
+    monkeypatch.setattr("os.rename", locked)
+    logger = functions.get_logger("themeswitch.test")
+    for i in range(200):
+        logger.info("line %s", i)
+    functions.flush_logs()
+    assert "line 199" in (log_dir / "full.log").read_text()
+    assert not (log_dir / "full.log.1").exists()
+
+
+def test_short_lived_processes_do_not_rotate(tmp_path):
+    previous = functions.log_file().parent
+    (tmp_path / "full.log").write_text("x" * 4096)
+    functions.setup_logging(tmp_path, max_bytes=2048)
+    try:
+        functions.get_logger("themeswitch.test").info("appended")
+        functions.flush_logs()
+    finally:
+        functions.setup_logging(previous)
+    assert sorted(p.name for p in tmp_path.glob("full.log*")) == ["full.log"]
+    assert "appended" in (tmp_path / "full.log").read_text()
@@ -0,0 +1,68 @@
+import os
+
+from themeswitch import logtail
+from themeswitch.logtail import LogReader
+
+
+def write_lines(path, start, stop, mode="a"):
+    with open(path, mode, encoding="utf-8") as file:
+        file.writelines(f"line {i}\n" for i in range(start, stop))
+
+
+def test_tail_reads_last_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(logtail, "BLOCK_SIZE", 64)  # Force several blocks
+    path = tmp_path / "full.log"
+    write_lines(path, 0, 1000)
+    reader = LogReader(path)
+    assert reader.tail(3) == "line 997\nline 998\nline 999\n"
+    assert reader.has_older()
+
+
+def test_older_pages_back_to_the_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(logtail, "BLOCK_SIZE", 64)
+    path = tmp_path / "full.log"
+    write_lines(path, 0, 25)
+    reader = LogReader(path)
+    pages = [reader.tail(10)]
+    while reader.has_older():
+        pages.insert(0, reader.older(10))
+    assert len(pages) == 3
+    assert "".join(pages) == path.read_text()
+
+
+def test_follow_reads_complete_new_lines(tmp_path):
+    path = tmp_path / "full.log"
+    write_lines(path, 0, 5)
+    reader = LogReader(path)
+    reader.tail(2)
+    assert reader.follow() == ("", False)
+    write_lines(path, 5, 7)
+    with open(path, "a") as file:
+        file.write("partial")
+    assert reader.follow() == ("line 5\nline 6\n", False)
+    with open(path, "a") as file:
+        file.write(" line\n")
+    assert reader.follow() == ("partial line\n", False)
+
+
+def test_follow_restarts_after_rotation(tmp_path):
+    path = tmp_path / "full.log"
+    write_lines(path, 0, 100)
+    reader = LogReader(path)
+    reader.tail(5)
+    os.replace(path, tmp_path / "full.log.1")
+    write_lines(path, 100, 102, mode="w")
+    assert reader.follow() == ("line 100\nline 101\n", True)
+    assert not reader.has_older()
+
+
+def test_missing_file(tmp_path):
+    reader = LogReader(tmp_path / "full.log")
+    assert reader.tail() == ""
+    assert reader.follow() == ("", False)
+
+
+def test_chunks_cover_the_file(tmp_path):
+    path = tmp_path / "full.log"
+    write_lines(path, 0, 500)
+    assert "".join(LogReader(path).chunks(size=100)) == path.read_text()
@@ -0,0 +1,94 @@
+import pytest
+
+from themeswitch import functions, metrics
+from themeswitch.__main__ import main, parse_command
+from themeswitch.metrics import Metrics, Sample, parse_window, read_samples, report
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_span_records_failures(tmp_path):
+    registry = Metrics(tmp_path / "metrics.log")
+    with registry.span('step'):
+        pass
+    with pytest.raises(OSError):
+        with registry.span('step'):
+            raise OSError("failed")
+    assert registry.counters == {'step': 2, 'step.failed': 1}
+    assert len(registry.histograms['step']) == 2
+
+
+def test_flush_appends_and_reads_back(tmp_path):
+    path = tmp_path / "metrics.log"
+    clock = FakeClock()
+    registry = Metrics(path, clock)
+    registry.record('switch.brightness', 0.008)
+    registry.flush()
+    clock.now += 3600
+    registry.record('switch.brightness', 0.012, ok=False)
+    registry.flush()
+    registry.flush()  # Nothing pending
+    assert path.read_text().splitlines() == ["1700000000.000 switch.brightness 8.000 1",
+                                             "1700003600.000 switch.brightness 12.000 0"]
+    assert read_samples(path) == [Sample(1700000000.0, 'switch.brightness', 0.008, True),
+                                  Sample(1700003600.0, 'switch.brightness', 0.012, False)]
+    assert [sample.ok for sample in read_samples(path, since=clock.now)] == [False]
+
+
+def test_file_is_trimmed(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_BYTES", 1000)
+    path = tmp_path / "metrics.log"
+    registry = Metrics(path)
+    for _ in range(100):
+        registry.record('step', 0.001)
+        registry.flush()
+    assert path.stat().st_size < 2000
+    assert len(read_samples(path)) > 10
+
+
+def test_unreadable_lines_are_skipped(tmp_path):
+    path = tmp_path / "metrics.log"
+    path.write_text("garbage\n1700000000.000 step 1.000 1\n1700000000.000 step")
+    assert len(read_samples(path)) == 1
+    assert read_samples(tmp_path / "missing.log") == []
+
+
+def test_report():
+    samples = [Sample(0, 'switch.total', duration / 1000, duration != 30) for duration in range(1, 31)]
+    lines = report(samples).splitlines()
+    assert lines[0].split() == ["name", "runs", "failed", "p50", "ms", "p95", "ms", "max", "ms"]
+    assert lines[1].split() == ["switch.total", "30", "1", "16.0", "29.0", "30.0"]
+    assert report([]) == "No samples recorded."
+
+
+@pytest.mark.parametrize("text, seconds", [("30m", 1800), ("24h", 86400), ("7d", 604800), ("1.5h", 5400)])
+def test_parse_window(text, seconds):
+    assert parse_window(text) == seconds
+
+
+def test_parse_stats_command():
+    assert parse_command(["--stats"]) == ('stats', ['7d'])
+    assert parse_command(["--stats", "24h"]) == ('stats', ['24h'])
+    with pytest.raises(SystemExit):
+        parse_command(["--stats", "yesterday"])
+
+
+def test_switch_records_every_step(backend, metrics_file):
+    backend.errors['set_brightness'] = OSError("WMI unavailable")
+    functions.change_sys_theme(40, "", 0)
+    names = {sample.name: sample.ok for sample in read_samples(metrics_file)}
+    assert names == {'switch.prepare_wallpaper': True, 'switch.read_state': True, 'switch.brightness': False,
+                     'switch.theme': True, 'switch.total': False}
+
+
+def test_stats_prints_report(backend, settings, metrics_file, capsys):
+    functions.change_sys_theme(40, "", 0)
+    main(["--stats", "1h"])
+    out = capsys.readouterr().out
+    assert "switch.total" in out and "p95 ms" in out
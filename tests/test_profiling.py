@@ -0,0 +1,78 @@
+import pstats
+import threading
+import time
+
+import pytest
+
+from themeswitch import functions
+from themeswitch.__main__ import handle_command, main, parse_command
+from themeswitch.backend import APPS_THEME
+from themeswitch.profiling import Profiler, sample_stacks, write_folded
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    path = tmp_path / "logs"
+    monkeypatch.setattr(functions, "log_file", lambda: path / "full.log")
+    return path
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(200)]
+
+
+def test_profiler_writes_stats_and_allocations(tmp_path):
+    with Profiler(tmp_path, "test", top=5) as profiler:
+        kept = allocate()
+    assert kept
+    stats = pstats.Stats(profiler.stats_path)
+    assert any(func[2] == "allocate" for func in stats.stats)
+    summary = open(profiler.summary_path).read().splitlines()
+    assert summary[0].startswith("test: ")
+    assert "test_profiling.py" in summary[2]
+    assert len(summary) <= 7
+
+
+def test_sample_stacks_sees_other_threads(tmp_path):
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            time.sleep(0.001)
+    thread = threading.Thread(target=busy, name="busy")
+    thread.start()
+    try:
+        stacks = sample_stacks(0.1, 0.01)
+    finally:
+        stop.set()
+        thread.join()
+    assert any(stack[0] == "busy" and stack[-1].startswith("busy ") for stack in stacks)
+    path = tmp_path / "samples.folded"
+    write_folded(path, stacks)
+    line = path.read_text().splitlines()[0]
+    assert int(line.rsplit(" ", 1)[1]) == max(stacks.values())
+
+
+def test_parse_profile():
+    assert parse_command(["-d", "--profile"]) == ('dark', ['--profile'])
+    assert parse_command(["--profile"]) == ('open', ['--profile'])
+    assert parse_command(["--reload-settings", "--profile"]) == ('reload-settings', [])
+
+
+def test_cold_switch_is_profiled(backend, settings, profile_dir, instance_address):
+    main(["-d", "--profile"])
+    assert backend.themes[APPS_THEME] == 0
+    assert len(list(profile_dir.glob("profile-*-switch-dark.prof"))) == 1
+    assert len(list(profile_dir.glob("profile-*-switch-dark-allocations.txt"))) == 1
+
+
+def test_running_instance_profiles_forwarded_switch(backend, settings, profile_dir):
+    handle_command('toggle', ['--profile'], show_window=None)
+    functions.get_switch_queue().submit('wait', lambda: None).result(5)
+    assert backend.themes[APPS_THEME] == 0
+    assert len(list(profile_dir.glob("profile-*-switch-toggle.prof"))) == 1
+
+
+def test_running_instance_is_sampled(profile_dir, monkeypatch):
+    monkeypatch.setattr(functions, "sample_process", lambda: "samples.folded")
+    assert handle_command('open', ['--profile'], show_window=None).endswith("samples.folded")
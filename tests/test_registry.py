@@ -0,0 +1,85 @@
+import pytest
+
+from themeswitch.backend import APPS_THEME, PERSONALIZE_KEY, SYSTEM_THEME
+from themeswitch.registry import RegistrySession
+
+
+class FakeWinreg:
+    HKEY_CURRENT_USER = "HKCU"
+    KEY_QUERY_VALUE = 1
+    KEY_SET_VALUE = 2
+    REG_DWORD = 4
+
+    def __init__(self):
+        self.values = {APPS_THEME: 1, SYSTEM_THEME: 1}
+        self.opens = self.queries = self.sets = 0
+        self.open_keys = set()
+        self.fail_next = False
+
+    def OpenKey(self, root, path, reserved, access):
+        self.opens += 1
+        key = object()
+        self.open_keys.add(key)
+        return key
+
+    def CloseKey(self, key):
+        self.open_keys.discard(key)
+
+    def _check(self, key):
+        if self.fail_next or key not in self.open_keys:
+            self.fail_next = False
+            raise OSError(6, "The handle is invalid")
+
+    def QueryValueEx(self, key, name):
+        self._check(key)
+        self.queries += 1
+        if name not in self.values:
+            raise FileNotFoundError(2, "The system cannot find the file specified")
+        return self.values[name], self.REG_DWORD
+
+    def SetValueEx(self, key, name, reserved, kind, value):
+        self._check(key)
+        self.sets += 1
+        self.values[name] = value
+
+
+@pytest.fixture
+def winreg():
+    return FakeWinreg()
+
+
+@pytest.fixture
+def session(winreg):
+    return RegistrySession(winreg, PERSONALIZE_KEY)
+
+
+def test_key_is_opened_once(winreg, session):
+    for value in (0, 1, 0):
+        session.write({APPS_THEME: value, SYSTEM_THEME: value})
+        assert session.read(APPS_THEME) == value
+    assert winreg.opens == 1
+    assert winreg.values == {APPS_THEME: 0, SYSTEM_THEME: 0}
+
+
+def test_every_value_is_written(winreg, session):
+    # Skipping values already set is up to the caller, so a forced switch still writes them
+    session.write({APPS_THEME: 1, SYSTEM_THEME: 0})
+    assert winreg.sets == 2
+    assert winreg.queries == 0
+
+
+def test_missing_value_does_not_reopen(winreg, session):
+    del winreg.values[SYSTEM_THEME]
+    for _ in range(3):
+        with pytest.raises(FileNotFoundError):
+            session.read(SYSTEM_THEME)
+    assert winreg.opens == 1
+
+
+def test_reopens_after_error(winreg, session):
+    session.read(APPS_THEME)
+    winreg.fail_next = True
+    session.write({APPS_THEME: 0})
+    assert winreg.values[APPS_THEME] == 0
+    assert winreg.opens == 2
+    assert len(winreg.open_keys) == 1
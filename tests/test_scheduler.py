@@ -0,0 +1,134 @@
+import copy
+import datetime
+import threading
+
+from themeswitch import functions
+from themeswitch.backend import APPS_THEME
+from themeswitch.scheduler import Scheduler, next_occurrence
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += datetime.timedelta(**kwargs)
+
+
+def schedule(settings, dark=(19, 0), light=(7, 30)):
+    settings = copy.deepcopy(settings)
+    for mode, (hour, minute) in (('dark_mode', dark), ('light_mode', light)):
+        settings[mode].update(enable_schedule=True, start_hour=hour, start_minute=minute)
+    return settings
+
+
+def test_next_occurrence():
+    now = datetime.datetime(2024, 3, 1, 12, 0)
+    assert next_occurrence(now, 19, 0) == datetime.datetime(2024, 3, 1, 19, 0)
+    assert next_occurrence(now, 7, 30) == datetime.datetime(2024, 3, 2, 7, 30)
+    assert next_occurrence(now, 12, 0) == datetime.datetime(2024, 3, 2, 12, 0)
+
+
+def test_transitions_fire_in_order(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 12, 0))
+    fired = []
+    scheduler = Scheduler(fired.append, clock)
+    scheduler.update(schedule(settings))
+    assert scheduler.next_transition() == (datetime.datetime(2024, 3, 1, 19, 0), 'dark_mode')
+
+    assert scheduler.run_pending() is None
+    clock.advance(hours=7)
+    assert scheduler.run_pending() == 'dark_mode'
+    assert scheduler.next_transition() == (datetime.datetime(2024, 3, 2, 7, 30), 'light_mode')
+    clock.advance(hours=12, minutes=30)
+    assert scheduler.run_pending() == 'light_mode'
+    assert fired == ['dark_mode', 'light_mode']
+
+
+def test_only_latest_missed_transition_fires(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 12, 0))
+    fired = []
+    scheduler = Scheduler(fired.append, clock)
+    scheduler.update(schedule(settings))
+    clock.advance(days=1)  # Asleep through both transitions
+    scheduler.run_pending()
+    assert fired == ['light_mode']
+    assert scheduler.next_transition() == (datetime.datetime(2024, 3, 2, 19, 0), 'dark_mode')
+
+
+def test_subscribers_are_told_after_switch(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 18, 59))
+    events = []
+    scheduler = Scheduler(lambda mode: events.append(('switch', mode)), clock)
+    scheduler.subscribe(lambda mode: events.append(('switched', mode)))
+    scheduler.update(schedule(settings))
+    clock.advance(minutes=1)
+    scheduler.run_pending()
+    assert events == [('switch', 'dark_mode'), ('switched', 'dark_mode')]
+
+
+def test_handles_only_scheduled_modes_while_running(settings):
+    scheduler = Scheduler(lambda mode: None)
+    settings = schedule(settings)
+    settings['light_mode']['enable_schedule'] = False
+    scheduler.update(settings)
+    assert not scheduler.handles('dark_mode')
+    scheduler.start()
+    try:
+        assert scheduler.handles('dark_mode')
+        assert not scheduler.handles('light_mode')
+    finally:
+        scheduler.stop()
+    assert not scheduler.handles('dark_mode')
+
+
+def test_disabled_mode_is_not_scheduled(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 12, 0))
+    scheduler = Scheduler(lambda mode: None, clock)
+    settings = schedule(settings)
+    settings['dark_mode']['enable_schedule'] = False
+    scheduler.update(settings)
+    assert scheduler.next_transition() == (datetime.datetime(2024, 3, 2, 7, 30), 'light_mode')
+    settings['light_mode']['enable_schedule'] = False
+    scheduler.update(settings)
+    assert scheduler.next_transition() is None
+
+
+def test_failing_action_keeps_schedule(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 18, 59))
+
+    def fail(mode):
+        raise OSError("switch failed")
+    scheduler = Scheduler(fail, clock)
+    scheduler.update(schedule(settings))
+    clock.advance(minutes=1)
+    assert scheduler.run_pending() == 'dark_mode'
+    assert scheduler.next_transition()[1] == 'light_mode'
+
+
+def test_thread_fires_when_clock_reaches_deadline(settings):
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 18, 59))
+    fired = threading.Event()
+    scheduler = Scheduler(lambda mode: fired.set(), clock)
+    scheduler.update(schedule(settings))
+    scheduler.start()
+    try:
+        assert not fired.wait(0.1)
+        clock.advance(minutes=1)
+        scheduler.wake()
+        assert fired.wait(2)
+    finally:
+        scheduler.stop()
+
+
+def test_scheduled_switch_applies_settings(backend, settings_file):
+    functions.get_store().save(schedule(functions.load_settings()))
+    clock = FakeClock(datetime.datetime(2024, 3, 1, 18, 59))
+    scheduler = Scheduler(functions.switch_to_mode, clock)
+    scheduler.update(functions.load_settings())
+    clock.advance(minutes=1)
+    scheduler.run_pending()
+    assert backend.themes[APPS_THEME] == 0
@@ -0,0 +1,130 @@
+import copy
+import datetime
+import time
+
+import pytest
+import yaml
+
+from themeswitch import functions
+from themeswitch.scheduler import Scheduler
+from themeswitch.solar import NO_EVENT, SolarTables, compute_year
+
+np = pytest.importorskip("numpy")
+
+NEW_YORK = (40.71, -74.01)
+
+
+@pytest.fixture
+def utc_local_time(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("The local time zone can't be changed on this platform")
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def solar(settings, enabled=True, location=NEW_YORK):
+    settings = copy.deepcopy(settings)
+    settings['solar'] = {'enabled': enabled, 'latitude': location[0], 'longitude': location[1]}
+    for mode in ('dark_mode', 'light_mode'):
+        settings[mode]['enable_schedule'] = True
+    return settings
+
+
+def test_year_matches_published_times():
+    table = compute_year(*NEW_YORK, 2024)
+    assert table.shape == (366, 2) and table.dtype == np.int16
+    # 2024-06-20: sunrise 05:25 EDT, sunset 20:31 EDT. 2024-12-21: sunrise 07:17 EST, sunset 16:32 EST
+    assert np.all(np.abs(table[171] - [9 * 60 + 25, 24 * 60 + 31]) <= 3)
+    assert np.all(np.abs(table[355] - [12 * 60 + 17, 21 * 60 + 32]) <= 3)
+    assert compute_year(0, 0, 2023).shape == (365, 2)
+
+
+def test_polar_day_and_night_have_no_event():
+    table = compute_year(78.22, 15.65, 2024)  # Longyearbyen
+    assert np.all(table[171] == NO_EVENT)
+    assert np.all(table[355] == NO_EVENT)
+    assert np.all(table[80] != NO_EVENT)
+
+
+def test_tables_are_computed_once(tmp_path):
+    tables = SolarTables(tmp_path)
+    first = tables.table(*NEW_YORK, 2024)
+    assert tables.table(40.7128, -74.0060, 2024) is first  # Same location once rounded
+    assert tables.computed == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["+40.71_-74.01_2024.npy"]
+
+    reopened = SolarTables(tmp_path)
+    assert np.array_equal(reopened.table(*NEW_YORK, 2024), first)
+    assert reopened.computed == 0
+
+
+def test_corrupted_table_is_computed_again(tmp_path):
+    (tmp_path / "+40.71_-74.01_2024.npy").write_bytes(b"garbage")
+    tables = SolarTables(tmp_path)
+    assert tables.table(*NEW_YORK, 2024).shape == (366, 2)
+    assert tables.computed == 1
+
+
+def test_next_event(tmp_path, utc_local_time):
+    tables = SolarTables(tmp_path)
+    sunset = tables.next_event(*NEW_YORK, 'sunset', datetime.datetime(2024, 6, 20, 12, 0))
+    assert datetime.datetime(2024, 6, 21, 0, 28) <= sunset <= datetime.datetime(2024, 6, 21, 0, 34)
+    after = tables.next_event(*NEW_YORK, 'sunset', sunset)
+    assert datetime.timedelta(hours=23, minutes=58) <= after - sunset <= datetime.timedelta(hours=24, minutes=2)
+    # The sunset of the last day of the year comes from the next year's table
+    assert tables.next_event(*NEW_YORK, 'sunset', datetime.datetime(2024, 12, 31, 23, 0)).year == 2025
+    assert tables.next_event(78.22, 15.65, 'sunrise', datetime.datetime(2024, 6, 20, 12, 0)) is None
+
+
+def test_old_settings_without_solar_are_valid(settings_file):
+    functions.load_settings()
+    settings = yaml.safe_load(settings_file.read_text())
+    assert functions.check_settings(settings) and settings['solar']['enabled'] is False
+    del settings['solar']
+    assert functions.check_settings(settings)
+    assert functions.scheduled_settings(settings) is settings
+
+
+@pytest.mark.parametrize("solar_settings", [
+    {'enabled': True, 'latitude': 91, 'longitude': 0},
+    {'enabled': True, 'latitude': 0, 'longitude': "east"},
+    {'enabled': "yes", 'latitude': 0, 'longitude': 0},
+    {'enabled': True, 'latitude': 0},
+])
+def test_invalid_solar_settings(settings_file, solar_settings):
+    functions.load_settings()
+    settings = yaml.safe_load(settings_file.read_text())
+    settings['solar'] = solar_settings
+    assert not functions.check_settings(settings)
+
+
+def test_tasks_follow_the_sun(backend, settings, utc_local_time):
+    settings = solar(settings)
+    now = datetime.datetime(2024, 6, 20, 12, 0)
+    scheduled = functions.scheduled_settings(settings, now)
+    assert (scheduled['dark_mode']['start_hour'], scheduled['light_mode']['start_hour']) == ("00", "09")
+    assert settings['dark_mode']['start_hour'] == "07"  # Not changed in place
+    functions.check_tasks(settings)
+    start_time = backend.scheduler.tasks['change to dark mode']['start_time']
+    assert start_time == "{0}:{1}".format(*(functions.scheduled_settings(settings)['dark_mode'][key]
+                                            for key in ('start_hour', 'start_minute')))
+
+
+def test_scheduler_follows_the_sun(settings, utc_local_time):
+    clock = [datetime.datetime(2024, 6, 20, 12, 0)]
+    fired = []
+    scheduler = Scheduler(fired.append, lambda: clock[0], sun=functions.next_solar_transition)
+    scheduler.update(solar(settings))
+    sunset, mode = scheduler.next_transition()
+    assert mode == 'dark_mode' and sunset.hour == 0
+    clock[0] = sunset
+    assert scheduler.run_pending() == 'dark_mode'
+    deadlines = sorted(scheduler._heap)
+    assert deadlines[0][1] == 'light_mode'
+    assert datetime.timedelta(hours=23, minutes=58) <= deadlines[1][0] - sunset <= datetime.timedelta(hours=24,
+                                                                                                      minutes=2)
+    scheduler.update(solar(settings, enabled=False))
+    assert scheduler.next_transition() == (datetime.datetime(2024, 6, 21, 7, 0), 'dark_mode')
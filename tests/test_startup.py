@@ -0,0 +1,106 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from themeswitch import instance
+
+GUI_MODULES = {'tkinter', 'pystray', 'PIL', 'themeswitch.gui'}
+IMPORT_BUDGET = 0.25  # Seconds of import time allowed on the headless path
+
+HEADLESS_SWITCH = """
+import sys
+from pathlib import Path
+from themeswitch import functions
+from themeswitch.backend import FakeBackend
+functions.SETTINGS_FILE = Path(sys.argv[1])
+functions.set_backend(FakeBackend())
+from themeswitch.__main__ import main
+main(['-d'])
+"""
+
+
+def import_times(code, *args):
+    """
+    Run ``code`` in a new interpreter with ``-X importtime``
+
+    :return: Maps every imported module to its own import time in seconds
+    :rtype: dict
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code] + list(args),
+                             cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(self_us) / 1e6
+    return modules
+
+
+@pytest.fixture
+def headless_imports(tmp_path):
+    return import_times(HEADLESS_SWITCH, str(tmp_path / "settings.yaml"))
+
+
+def test_headless_switch_does_not_import_gui(headless_imports):
+    assert 'themeswitch.__main__' in headless_imports
+    gui_imports = [name for name in headless_imports if name in GUI_MODULES or name.split(".")[0] in GUI_MODULES]
+    assert gui_imports == []
+
+
+@pytest.mark.bench
+def test_headless_import_budget(headless_imports):
+    assert sum(headless_imports.values()) < IMPORT_BUDGET
+
+
+def test_force_alone_does_not_switch(backend, settings, instance_address, monkeypatch):
+    from themeswitch.__main__ import main
+
+    monkeypatch.setitem(sys.modules, 'themeswitch.gui', None)  # Stop at the GUI import
+    with pytest.raises(ImportError):
+        main(['-f'])
+    assert backend.calls == []
+    assert instance.forward(instance_address, "ping") is None  # The GUI failed to start and released the lock
+
+
+def test_force_applies_values_already_set(backend, settings, instance_address):
+    from themeswitch.__main__ import main
+
+    main(['-d'])
+    writes = backend.count('set_brightness')
+    main(['-d', '-f'])
+    assert backend.count('set_brightness') == writes + 1
+
+
+def test_startup_tasks_run_after_the_window(backend, settings, monkeypatch):
+    from themeswitch import functions
+    from themeswitch.__main__ import run_startup_tasks
+
+    settings['dark_mode'].update(enable_schedule=True, wallpaper="C:\\dark.jpg")
+    functions.get_store().save(settings)
+    warned = []
+    try:
+        run_startup_tasks(warned.append)
+        assert functions.get_scheduler().handles('dark_mode')
+    finally:
+        functions.get_scheduler().stop()
+    assert warned == [['light_mode']]
+    assert 'change to dark mode' in backend.scheduler.tasks
+
+
+def test_failed_task_check_does_not_stop_startup(backend, settings, caplog):
+    from themeswitch import functions
+    from themeswitch.__main__ import run_startup_tasks
+
+    settings['dark_mode']['enable_schedule'] = True
+    functions.get_store().save(settings)
+    backend.errors['run_command'] = OSError("schtasks failed")
+    warned = []
+    try:
+        run_startup_tasks(warned.append)
+    finally:
+        functions.get_scheduler().stop()
+    assert warned == [['dark_mode', 'light_mode']]
+    assert "Could not check the scheduled tasks" in caplog.text
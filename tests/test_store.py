@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+import yaml
+
+from themeswitch import functions
+from themeswitch.store import SettingsWriter
+
+
+def touch(path, settings):
+    path.write_text(yaml.dump(settings))
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_settings_are_parsed_once(settings_file):
+    store = functions.get_store()
+    for _ in range(100):
+        functions.load_settings()
+    assert store.parses == 0  # The file didn't exist; defaults were written and cached without reparsing
+    touch(settings_file, functions.load_settings())
+    for _ in range(100):
+        functions.load_settings()
+    assert store.parses == 1
+
+
+def test_returned_settings_are_copies(settings_file):
+    functions.load_settings()['dark_mode']['brightness'] = 55
+    assert functions.load_settings()['dark_mode']['brightness'] == 0
+
+
+def test_changes_are_pushed_to_subscribers(settings_file):
+    store = functions.get_store()
+    settings = functions.load_settings()
+    received = []
+    store.subscribe(received.append)
+    assert not store.refresh()
+    settings['dark_mode']['brightness'] = 30
+    touch(settings_file, settings)
+    assert store.refresh()
+    assert [s['dark_mode']['brightness'] for s in received] == [30]
+
+
+def test_invalid_file_keeps_last_valid_settings(settings_file):
+    settings = functions.load_settings()
+    settings['dark_mode']['brightness'] = 30
+    functions.get_store().save(settings)
+    touch(settings_file, {'dark_mode': 3})  # Half-saved edit from an external editor
+    assert functions.load_settings() == settings
+    assert yaml.safe_load(settings_file.read_text()) == {'dark_mode': 3}  # Not overwritten
+    settings_file.write_text("dark_mode: [unclosed")
+    assert functions.load_settings() == settings
+    settings['dark_mode']['brightness'] = 40
+    touch(settings_file, settings)  # The edit is finished
+    assert functions.load_settings() == settings
+
+
+def test_save_is_atomic_and_skips_unchanged_content(settings_file):
+    store = functions.get_store()
+    settings = functions.load_settings()
+    writes = store.writes
+    assert not store.save(settings)
+    settings['light_mode']['brightness'] = 80
+    assert store.save(settings)
+    assert store.writes == writes + 1
+    assert yaml.safe_load(settings_file.read_text())['light_mode']['brightness'] == 80
+    assert [p.name for p in settings_file.parent.iterdir()] == [settings_file.name]
+
+
+def test_invalid_settings_are_not_written(settings_file):
+    store = functions.get_store()
+    settings = functions.load_settings()
+    before = settings_file.read_text()
+    settings['dark_mode']['brightness'] = 300
+    with pytest.raises(ValueError):
+        store.save(settings)
+    assert settings_file.read_text() == before
+
+
+def test_writer_coalesces_edits(settings_file):
+    store = functions.get_store()
+    settings = functions.load_settings()
+    writer = SettingsWriter(store, delay=0.05)
+    writes = store.writes
+    for value in range(0, 60):
+        settings['dark_mode']['brightness'] = value
+        writer.update(settings)
+    time.sleep(0.2)
+    assert store.writes == writes + 1
+    assert functions.load_settings()['dark_mode']['brightness'] == 59
+
+
+def test_writer_flush(settings_file):
+    store = functions.get_store()
+    settings = functions.load_settings()
+    writer = SettingsWriter(store, delay=60)
+    settings['dark_mode']['wallpaper'] = "C:\\dark.jpg"
+    writer.update(settings)
+    assert writer.flush()
+    assert not writer.flush()
+    assert functions.load_settings()['dark_mode']['wallpaper'] == "C:\\dark.jpg"
@@ -0,0 +1,74 @@
+import pytest
+
+from themeswitch import functions, tasks
+
+QUERY_24H = ('"\\Theme Switch\\Change to Dark Mode","18/10/2026 19:00:00","Ready"\n'
+             '"\\Theme Switch\\Change to Light Mode","N/A","Disabled"\n')
+QUERY_12H = ('"\\Theme Switch\\Change to Dark Mode","10/18/2026 7:00:00 PM","Ready"\n'
+             '"\\Theme Switch\\Change to Light Mode","10/19/2026 7:05:00 AM","Ready"\n')
+
+
+class CannedRunner:
+    def __init__(self, query_output):
+        self.query_output = query_output
+        self.commands = []
+
+    def __call__(self, command):
+        self.commands.append(command)
+        return self.query_output if "/QUERY" in command else ""
+
+
+def schedule(settings, dark=None, light=None):
+    for mode, start_time in (('dark_mode', dark), ('light_mode', light)):
+        settings[mode]['enable_schedule'] = start_time is not None
+        if start_time:
+            settings[mode]['start_hour'], settings[mode]['start_minute'] = start_time.split(":")
+    return settings
+
+
+@pytest.mark.parametrize("next_run, expected", [
+    ("18/10/2026 19:00:00", "19:00"),
+    ("10/18/2026 7:00:00 PM", "19:00"),
+    ("10/18/2026 12:30:00 AM", "00:30"),
+    ("N/A", None),
+])
+def test_parse_time(next_run, expected):
+    assert tasks.parse_time(next_run) == expected
+
+
+def test_parse_query():
+    snapshot = tasks.parse_query(QUERY_24H)
+    assert snapshot == {
+        'change to dark mode': tasks.TaskState("Change to Dark Mode", "19:00", True),
+        'change to light mode': tasks.TaskState("Change to Light Mode", None, False),
+    }
+
+
+def test_nothing_to_do_is_a_single_query(settings):
+    run = CannedRunner(QUERY_12H)
+    assert tasks.reconcile(schedule(settings, dark="19:00", light="07:05"), run) == []
+    assert len(run.commands) == 1
+
+
+def test_corrections_are_batched(settings):
+    run = CannedRunner(QUERY_24H)
+    corrections = tasks.reconcile(schedule(settings, dark=None, light="07:00"), run)
+    assert len(corrections) == 2
+    assert len(run.commands) == 2
+    assert run.commands[1] == " & ".join([tasks.change_command('dark_mode', "DISABLE"),
+                                          tasks.create_command('light_mode', "07:00")])
+
+
+def test_missing_tasks_are_only_created_when_enabled(settings):
+    run = CannedRunner("")
+    assert tasks.reconcile(schedule(settings), run) == []
+    assert len(run.commands) == 1
+
+
+def test_startup_spawns_at_most_two_processes(backend, settings):
+    backend.scheduler.add("Change to Dark Mode", "08:30", enabled=False)
+    functions.check_tasks(schedule(settings, dark="19:00", light="07:00"))
+    functions.check_tasks(settings)
+    assert backend.count('run_command') == 3
+    assert {t['name']: (t['start_time'], t['enabled']) for t in backend.scheduler.tasks.values()} == {
+        "Change to Dark Mode": ("19:00", True), "Change to Light Mode": ("07:00", True)}
@@ -0,0 +1,55 @@
+import threading
+
+from themeswitch import functions
+from themeswitch.backend import APPS_THEME, SYSTEM_THEME
+from themeswitch.themestate import PollingNotifier, ThemeState, FakeNotifier
+
+
+def test_repeated_queries_do_not_read_the_registry(backend):
+    for _ in range(1000):
+        functions.light_mode_is_on()
+    assert backend.count('read_theme') == 1
+
+
+def test_notification_invalidates(backend):
+    assert functions.light_mode_is_on()
+    backend.themes[APPS_THEME] = 0
+    assert functions.light_mode_is_on()  # Not notified yet
+    backend.notifier.fire()
+    assert not functions.light_mode_is_on()
+    assert backend.count('read_theme') == 2
+
+
+def test_own_writes_are_cached(backend):
+    functions.change_sys_theme(50, "", 0)
+    reads = backend.count('read_theme')
+    assert not functions.light_mode_is_on()
+    assert backend.count('read_theme') == reads
+
+
+def test_value_read_during_a_change_is_not_cached():
+    notifier = FakeNotifier()
+    values = {APPS_THEME: 1}
+
+    def read(name):
+        value = values[name]
+        values[name] = 0
+        notifier.fire()  # The key changes while it's being read
+        return value
+
+    state = ThemeState(read, notifier)
+    assert state.get(APPS_THEME) == 1
+    assert state.get(APPS_THEME) == 0
+
+
+def test_polling_notifier_reports_changes():
+    values = {APPS_THEME: 1, SYSTEM_THEME: 1}
+    changed = threading.Event()
+    notifier = PollingNotifier(values.get, (APPS_THEME, SYSTEM_THEME), interval=0.01)
+    notifier.start(changed.set)
+    try:
+        assert not changed.wait(0.05)
+        values[SYSTEM_THEME] = 0
+        assert changed.wait(1)
+    finally:
+        notifier.stop()
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from themeswitch import thumbnails
+from themeswitch.thumbnails import ThumbnailCache
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def image(tmp_path):
+    def make(name, size=(4000, 3000)):
+        path = tmp_path / name
+        Image.new("RGB", size, (10, 20, 30)).save(path, "JPEG")
+        return str(path)
+    return make
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ThumbnailCache(tmp_path / "thumbnails", max_entries=3)
+
+
+def test_image_size_reads_header(image):
+    assert thumbnails.image_size(image("wall.jpg", (4000, 3000))) == (4000, 3000)
+
+
+def test_thumbnail_is_decoded_once(cache, image):
+    source = image("wall.jpg")
+    assert cache.get(source).size == (128, 96)
+    assert ThumbnailCache(cache.directory).get(source).size == (128, 96)
+    assert cache.decodes == 1
+
+
+def test_modified_source_is_decoded_again(cache, image):
+    source = image("wall.jpg")
+    cache.get(source)
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    cache.get(source)
+    assert cache.decodes == 2
+
+
+def test_least_recently_used_are_evicted(cache, image):
+    sources = [image(f"wall{i}.jpg", (400, 300)) for i in range(4)]
+    for source in sources[:3]:
+        cache.get(source)
+    first = cache.entry_path(sources[0])
+    st = os.stat(first)
+    os.utime(first, ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000_000))  # sources[0] used most recently
+    cache.get(sources[3])
+    remaining = set(cache.directory.glob("*.png"))
+    assert remaining == {cache.entry_path(s) for s in (sources[0], sources[2], sources[3])}
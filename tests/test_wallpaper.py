@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from themeswitch import functions
+from themeswitch.wallpaper import WallpaperCache
+
+Image = pytest.importorskip("PIL.Image")
+
+SCREEN = (320, 180)
+
+
+@pytest.fixture
+def image(tmp_path):
+    def make(name, size=(1600, 1200), color=(200, 30, 30)):
+        path = tmp_path / name
+        Image.new("RGB", size, color).save(path, "JPEG")
+        return str(path)
+    return make
+
+
+@pytest.fixture
+def cache(wallpaper_cache_dir):
+    return WallpaperCache(wallpaper_cache_dir)
+
+
+def test_prepare_fits_to_screen(cache, image):
+    prepared = cache.prepare(image("dark.jpg"), SCREEN)
+    with Image.open(prepared) as img:
+        assert img.size == SCREEN
+
+
+def test_prepare_renders_once(cache, image):
+    source = image("dark.jpg")
+    first = cache.prepare(source, SCREEN)
+    assert cache.prepare(source, SCREEN) == first
+    assert WallpaperCache(cache.directory).prepare(source, SCREEN) == first
+    assert cache.renders == 1
+
+
+def test_changed_source_is_rendered_again(cache, image):
+    source = image("dark.jpg")
+    first = cache.prepare(source, SCREEN)
+    image("dark.jpg", color=(0, 0, 0))
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert cache.prepare(source, SCREEN) != first
+    assert cache.prepare(source, (640, 360)) != first
+    assert cache.renders == 3
+
+
+def test_evict_keeps_only_current_wallpapers(cache, image):
+    dark, light, old = image("dark.jpg"), image("light.jpg", color=(1, 2, 3)), image("old.jpg", color=(4, 5, 6))
+    for source in (dark, light, old):
+        cache.prepare(source, SCREEN)
+    cache.prepare(dark, (640, 360))
+    assert cache.evict([dark, light], SCREEN) == 2
+    assert sorted(p.name for p in cache.directory.glob("*.jpg")) == sorted(
+        p.name for p in (cache.prepare(dark, SCREEN), cache.prepare(light, SCREEN)))
+    assert cache.renders == 4
+
+
+def test_switch_sets_prefitted_wallpaper(backend, image):
+    backend.screen_size = SCREEN
+    source = image("dark.jpg")
+    functions.change_sys_theme(0, source, 0)
+    assert backend.wallpaper == str(functions.get_wallpaper_cache().prepare(source, SCREEN))
+    result = functions.change_sys_theme(0, source, 0)
+    assert 'wallpaper' in result.skipped
+
+
+def test_unreadable_wallpaper_is_set_as_is(backend, tmp_path):
+    functions.change_sys_theme(0, str(tmp_path / "missing.jpg"), 0)
+    assert backend.wallpaper == str(tmp_path / "missing.jpg")
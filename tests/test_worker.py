@@ -0,0 +1,75 @@
+import threading
+import time
+
+from themeswitch import functions
+from themeswitch.__main__ import change_mode_tray
+from themeswitch.backend import APPS_THEME
+from themeswitch.worker import SwitchQueue
+
+
+def test_duplicate_requests_collapse():
+    queue = SwitchQueue()
+    release = threading.Event()
+    calls = []
+
+    def switch():
+        calls.append(1)
+        release.wait(2)
+        return len(calls)
+    first = queue.submit('toggle', switch)
+    second = queue.submit('toggle', switch)  # Clicked again while the first one runs
+    assert first is second
+    assert queue.in_progress() == ['toggle']
+    release.set()
+    assert first.result(2) == 1
+    assert queue.submit('toggle', switch).result(2) == 2  # Done requests aren't collapsed
+    assert queue.in_progress() == []
+
+
+def test_requests_run_one_at_a_time():
+    queue = SwitchQueue()
+    running = []
+    overlaps = []
+
+    def switch():
+        running.append(1)
+        overlaps.append(len(running))
+        time.sleep(0.01)
+        running.pop()
+    futures = [queue.submit(key, switch) for key in ('dark_mode', 'light_mode', 'toggle')]
+    for future in futures:
+        future.result(2)
+    assert overlaps == [1, 1, 1]
+
+
+def test_subscribers_get_failures():
+    queue = SwitchQueue()
+    done = []
+    finished = threading.Event()
+    queue.subscribe(lambda key, future: (done.append((key, future.exception())), finished.set()))
+
+    def fail():
+        raise OSError("WMI unavailable")
+    queue.submit('dark_mode', fail)
+    assert finished.wait(2)
+    assert done[0][0] == 'dark_mode' and isinstance(done[0][1], OSError)
+
+
+def test_tray_toggle_does_not_block(slow_backend, settings):
+    slow_backend.latency['set_brightness'] = 0.2
+    start = time.perf_counter()
+    future = change_mode_tray()
+    assert change_mode_tray() is future
+    assert time.perf_counter() - start < 0.05
+    future.result(2)
+    assert slow_backend.themes[APPS_THEME] == 0
+    assert slow_backend.count('set_brightness') == 1
+    assert functions.describe_switch(future) == "Dark mode on"
+
+
+def test_describe_failed_switch(backend, settings):
+    backend.brightness = 0
+    backend.errors['set_brightness'] = OSError("WMI unavailable")
+    future = functions.queue_switch('light_mode')
+    future.result(2)
+    assert functions.describe_switch(future) == "Light mode on, but could not change: brightness"
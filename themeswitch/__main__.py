@@ -1,12 +1,9 @@
-from themeswitch import gui
 import themeswitch.functions as functions
-import tkinter as tk
-from pathlib import Path
+from themeswitch import instance, metrics
+from themeswitch.dispatch import Dispatcher
 import argparse
-from pystray import Menu, MenuItem
-import pystray
+import threading
 import time
-from PIL import Image
 
 logger = functions.get_logger(__name__)
 logger.info("Starting program.")
@@ -57,67 +54,275 @@ def exit_tray(root, icon):
     :rtype: None
     """
     logger.info("Closing program.")
+    functions.get_scheduler().stop()
     icon.visible = False
     icon.stop()
     root.destroy()
 
 
-def change_mode_tray(settings):
+def change_mode_tray(force=False):
     """
-    Change to Dark or Light mode (Whichever is inactive) from the System Tray
+    Change to Dark or Light mode (Whichever is inactive) from the System Tray.
+    Settings come from the settings store, so changes made after the program moved to the tray are used.
+    The switch runs on the switch queue, so the menu returns right away, and clicking again while it runs doesn't
+    start a second one.
 
-    :param settings: A dictionary with the contents of `settings.yaml`
-    :type settings: dict
+    :param force: Apply every setting even if it's already set
+    :type force: bool
+    :return: Future of the switch result
+    :rtype: :class:`concurrent.futures.Future`
+    """
+    return functions.queue_switch('toggle', force)
+
+
+def parse_command(argv=None):
+    """
+    Parse the command line into one of :data:`themeswitch.instance.COMMANDS`, or `stats`, which is run locally
+
+    :param argv: Command line arguments. Defaults to ``sys.argv[1:]``
+    :type argv: list
+    :return: The command and the list of its options, for example ``('dark', ['--force'])``
+    :rtype: tuple
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--darkmode", dest="command", action="store_const", const='dark')
+    ap.add_argument("-l", "--lightmode", dest="command", action="store_const", const='light')
+    ap.add_argument("-t", "--toggle", dest="command", action="store_const", const='toggle',
+                    help="change to whichever mode is inactive")
+    ap.add_argument("--reload-settings", dest="command", action="store_const", const='reload-settings',
+                    help="make the running instance read the settings file again")
+    ap.add_argument("--stats", nargs="?", const="7d", metavar="WINDOW",
+                    help="print how long switches and their steps took, and how often they failed, over the last "
+                         "WINDOW (for example 30m, 24h or 7d, the default)")
+    ap.add_argument("-f", "--force", action="store_true",
+                    help="with -d, -l or -t, apply every setting even if it already matches the current system state")
+    ap.add_argument("--profile", action="store_true",
+                    help="profile startup, or the switch with -d, -l or -t, and write the profile to the log "
+                         "directory. If the program is already running, sample it for {0} seconds "
+                         "instead".format(functions.SAMPLE_SECONDS))
+    ap.add_argument("--scheduled", action="store_true",
+                    help="used by the scheduled tasks: with -d or -l, do nothing if the program is running and "
+                         "switches at the scheduled time itself")
+    args = ap.parse_args(argv)
+    if args.stats is not None:
+        try:
+            metrics.parse_window(args.stats)
+        except ValueError as e:
+            ap.error(str(e))
+        return 'stats', [args.stats]
+    command = args.command or 'open'
+    options = []
+    if args.force and command in ('dark', 'light', 'toggle'):
+        options.append("--force")
+    if args.scheduled and command in ('dark', 'light'):
+        options.append("--scheduled")
+    if args.profile and command != 'reload-settings':
+        options.append("--profile")
+    return command, options
+
+
+def handle_command(command, options, show_window):
+    """
+    Run a command forwarded to the running instance. Switches go to the switch queue so the reply is sent right away
+
+    :param command: One of :data:`themeswitch.instance.COMMANDS`
+    :type command: str
+    :param options: Options sent with the command
+    :type options: list
+    :param show_window: Callable that brings the main window up. Called on the IPC thread, so it must only hand the
+        work to the Tk thread
+    :type show_window: callable
+    :return: The reply, or None for the default reply
+    :rtype: str
+    """
+    force = '--force' in options
+    profile = '--profile' in options
+    if command == 'open' and profile:
+        return "sampling for {0} seconds into {1}".format(functions.SAMPLE_SECONDS, functions.sample_process())
+    if command == 'open':
+        show_window()
+        return
+    if '--scheduled' in options and functions.get_scheduler().handles(command + '_mode'):
+        return "skipped, the running instance switches at the scheduled time"
+    if command in ('dark', 'light'):
+        functions.queue_switch(command + '_mode', force, profile)
+    elif command == 'toggle':
+        functions.queue_switch('toggle', force, profile)
+    else:
+        threading.Thread(target=functions.get_store().refresh, name=command, daemon=True).start()
+
+
+def refresh_tasks(mode=None):
+    """
+    Check the scheduled tasks against the current settings, logging any failure. Subscribed to the scheduler, so tasks
+    that follow sunrise and sunset move to the next day's times after every scheduled switch
+
+    :param mode: Mode that was just switched to, if called by the scheduler
+    :type mode: str
     :return: None
     :rtype: None
     """
-    mode = 'dark_mode' if functions.light_mode_is_on() else 'light_mode'
-    logger.info("Changed to %s", mode)
-    values = settings[mode]
-    functions.change_sys_theme(values['brightness'], values['wallpaper'], values['os_theme'])
+    try:
+        functions.check_tasks(functions.load_settings())
+    except Exception:
+        logger.exception("Could not check the scheduled tasks")
 
 
-def main():
+def run_startup_tasks(warn_missing_wallpapers, profile=False):
+    """
+    Startup work the main window doesn't need to be painted: start the in-process scheduler, check the wallpapers
+    and reconcile the scheduled tasks. Runs on a background thread once the window is up.
+
+    :param warn_missing_wallpapers: Callable taking the modes without a wallpaper. Called on this thread, so it must
+        only hand the work to the Tk thread
+    :type warn_missing_wallpapers: callable
+    :param profile: Profile this work, see :func:`themeswitch.functions.get_profiler`
+    :type profile: bool
+    :return: None
+    :rtype: None
+    """
+    profiler = functions.get_profiler('startup-background') if profile else None
+    if profiler is not None:
+        profiler.start()
+    try:
+        settings = functions.load_settings()
+        # While the program runs, it switches at the scheduled times itself. The scheduled tasks stay registered as
+        # a fallback for when it isn't running; if one fires while it is, it forwards its command and is told to skip.
+        scheduler = functions.get_scheduler()
+        scheduler.update(settings)
+        scheduler.start()
+        missing = functions.missing_wallpapers(settings)
+        if missing:
+            warn_missing_wallpapers(missing)
+        refresh_tasks()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+
+def main(argv=None):
     """
     Load settings and check the status of scheduled tasks. Parse and run with the arguments invoked when running the
     program if any. If no arguments where invoked, open the GUI and move the program to System Tray when closed.
 
+    Only one instance opens the GUI. If an instance is already running, the command is forwarded to it and this
+    process exits right away.
+
+    Switching from the command line only imports what the switch needs, and the scheduled tasks are checked after
+    the switch is done. The GUI modules are imported only when the GUI is opened.
+
+    :param argv: Command line arguments. Defaults to ``sys.argv[1:]``
+    :type argv: list
     :return: None
     :rtype: None
     """
+    start = time.perf_counter()
+    command, options = parse_command(argv)
+    if command == 'stats':
+        since = time.time() - metrics.parse_window(options[0])
+        print(metrics.report(metrics.read_samples(functions.METRICS_FILE, since)))
+        return
+    force = '--force' in options
+    profiler = functions.get_profiler('startup' if command == 'open' else 'switch-' + command) \
+        if '--profile' in options else None
+    message = " ".join([command] + options)
+    reply = instance.forward(functions.INSTANCE_ADDRESS, message)
+    if reply is not None:
+        logger.info("Forwarded '%s' to the running instance: %s", message, reply)
+        return
+    if command == 'reload-settings':
+        logger.info("No running instance to reload settings.")
+        return
+    if command != 'open':
+        if profiler is not None:
+            profiler.start()
+        settings = functions.load_settings()
+        if command == 'toggle':
+            command = 'dark' if functions.light_mode_is_on() else 'light'
+        values = settings[command + '_mode']
+        functions.change_sys_theme(values['brightness'], values['wallpaper'], values['os_theme'], force=force)
+        functions.check_tasks(settings)
+        if profiler is not None:
+            profiler.stop()
+        return
 
-    settings = functions.load_settings()
-    functions.check_tasks(settings)
-    ap = argparse.ArgumentParser()
-    ap.add_argument("-d", "--darkmode", action="store_const", const='dark_mode')
-    ap.add_argument("-l", "--lightmode", action="store_const", const='light_mode')
-    args = vars(ap.parse_args())
-    if any(args.values()):
-        mode = args['darkmode'] or args['lightmode']
-        if type(mode) == str:
-            values = settings[mode]
+    # Tk is only used from the main thread. Everything else (IPC, tray menu) posts its Tk work to ``ui``
+    ui = Dispatcher()
+    tray = {}
+
+    def show_window():
+        icon = tray.pop('icon', None)
+        if icon is not None:
+            reopen_program(root, icon)
         else:
-            values = settings['dark_mode'] if functions.light_mode_is_on() else settings['light_mode']
-        functions.change_sys_theme(values['brightness'], values['wallpaper'], values['os_theme'])
-    else:
+            root.deiconify()
+            root.lift()
+
+    def quit_program():
+        exit_tray(root, tray.pop('icon'))
+
+    server = instance.acquire(functions.INSTANCE_ADDRESS,
+                              lambda command, options: handle_command(command, options,
+                                                                      lambda: ui.post(show_window)))
+    if server is None:  # Another instance started meanwhile
+        instance.forward(functions.INSTANCE_ADDRESS, message)
+        return
+    # Only the instance holding the lock rotates the logs
+    functions.setup_logging(rotate=True)
+
+    try:
+        if profiler is not None:
+            profiler.start()
+        from themeswitch import gui
+        import tkinter as tk
+        from pystray import Menu, MenuItem
+        import pystray
+        from themeswitch import assets
+
+        functions.get_store().subscribe(lambda settings: threading.Thread(
+            target=functions.refresh_wallpaper_cache, args=(settings,), daemon=True).start())
+        functions.get_store().subscribe(functions.get_scheduler().update)
+        functions.get_scheduler().subscribe(refresh_tasks)
+        functions.get_store().watch()
+
         def on_closing():
-            settings = functions.load_settings()
             icon = pystray.Icon("ThemeSwitch")
-            icon.icon = Image.open(Path(__file__).parent / "../icons/icon.ico")
+            icon.icon = assets.image("icon.ico")
             icon.title = "Theme Switch"
             icon.menu = Menu(
-                MenuItem('Open', lambda: reopen_program(root, icon), default=True),
-                MenuItem('Change mode', lambda: change_mode_tray(settings)),
-                MenuItem('Quit', lambda: exit_tray(root, icon))
+                MenuItem('Open', lambda: ui.post(show_window), default=True),
+                MenuItem('Change mode', lambda: change_mode_tray()),
+                MenuItem('Quit', lambda: ui.post(quit_program))
             )
             root.withdraw()
-            icon.run(setup)
+            tray['icon'] = icon
+            # The icon runs its own loop on another thread, so the Tk loop keeps serving ``ui`` while in the tray
+            threading.Thread(target=icon.run, args=(setup,), name="tray", daemon=True).start()
         root = tk.Tk()
-        root.iconbitmap(True, Path(__file__).parent / "../icons/icon.ico")
+        root.iconbitmap(True, assets.ICONS_DIR / "icon.ico")
         root.title("Theme Switcher")
-        gui.MainWindow(root)
+        window = gui.MainWindow(root)
+        # The window is drawn by Tk's idle handlers; run them now so it shows before the rest of the startup work
+        root.update_idletasks()
+        functions.get_metrics().record('gui.first_paint', time.perf_counter() - start)
+        if profiler is not None:
+            profiler.stop()
+        threading.Thread(target=run_startup_tasks, name="startup",
+                         args=(lambda modes: ui.post(window.warn_missing_wallpapers, modes), profiler is not None),
+                         daemon=True).start()
+
+        def switched(key, future):
+            ui.post(window.get_active_mode)
+            icon = tray.get('icon')
+            if icon is not None:
+                icon.notify(functions.describe_switch(future))
+        functions.get_switch_queue().subscribe(switched)
         root.protocol("WM_DELETE_WINDOW", on_closing)
+        ui.start(root)
         root.mainloop()
+    finally:
+        # Also when the GUI fails to start, so the lock isn't held by a process that is exiting
+        server.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Shared image assets.
+
+Icons are decoded once per process with :func:`image`, and turned into a Tk image once per Tk interpreter with
+:func:`photo`. Everything that shows an icon (the windows and the System Tray icon) takes it from here.
+"""
+
+import threading
+from pathlib import Path
+
+ICONS_DIR = Path(__file__).parent / "../icons"
+
+_images = {}
+_lock = threading.Lock()
+
+
+def image(name):
+    """
+    Return the decoded icon ``name``. The file is only read the first time
+
+    :param name: File name inside the `icons` directory, for example `"moon.png"`
+    :type name: str
+    :return: The decoded image. It is shared, so it must not be modified
+    :rtype: :class:`PIL.Image.Image`
+    """
+    from PIL import Image
+
+    with _lock:
+        if name not in _images:
+            img = Image.open(ICONS_DIR / name)
+            img.load()
+            _images[name] = img
+        return _images[name]
+
+
+def photo(widget, name):
+    """
+    Return icon ``name`` as a Tk image that belongs to the interpreter of ``widget``. Every window of the same
+    interpreter gets the same object
+
+    :param widget: Any widget of the Tk interpreter that will display the image
+    :type widget: :class:`tkinter.Misc`
+    :param name: File name inside the `icons` directory, for example `"moon.png"`
+    :type name: str
+    :return: The Tk image
+    :rtype: :class:`PIL.ImageTk.PhotoImage`
+    """
+    from PIL import ImageTk
+
+    root = widget._root()
+    photos = root.__dict__.setdefault('_themeswitch_photos', {})
+    if name not in photos:
+        photos[name] = ImageTk.PhotoImage(image(name), master=root)
+    return photos[name]
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Platform backends used by :mod:`themeswitch.functions`.
+
+Every call that reaches the operating system (registry, WMI, user32 and the Task Scheduler command line) goes through
+a :class:`Backend`. :class:`WindowsBackend` is the real implementation and :class:`FakeBackend` keeps everything in
+memory, optionally sleeping to simulate the latency of each operation, so the program can be tested and measured
+outside a Windows desktop.
+"""
+
+import os
+import re
+import threading
+import time
+
+from themeswitch.brightness import BrightnessController
+from themeswitch.registry import RegistrySession
+from themeswitch.themestate import FakeNotifier, PollingNotifier, RegistryNotifier
+
+PERSONALIZE_KEY = "Software\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize"
+APPS_THEME = "AppsUseLightTheme"
+SYSTEM_THEME = "SystemUsesLightTheme"
+
+SPI_GETDESKWALLPAPER = 0x0073
+SPI_SETDESKWALLPAPER = 0x0014
+MAX_PATH = 260
+DESKTOPVERTRES = 117
+DESKTOPHORZRES = 118
+
+
+class Backend:
+    """
+    Interface between Theme Switch and the operating system. Subclasses must implement every method.
+    """
+
+    def read_theme(self, name):
+        """
+        Read a theme DWORD from the `Personalize` registry key
+
+        :param name: `AppsUseLightTheme` or `SystemUsesLightTheme`
+        :type name: str
+        :return: 0 for dark mode, 1 for light mode
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def write_theme(self, name, value):
+        """
+        Write a theme DWORD to the `Personalize` registry key
+
+        :param name: `AppsUseLightTheme` or `SystemUsesLightTheme`
+        :type name: str
+        :param value: 0 for dark mode, 1 for light mode
+        :type value: int
+        :return: None
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    def write_themes(self, values):
+        """
+        Write several theme DWORDs to the `Personalize` registry key. Backends that can do it in a single operation
+        should override this; by default each value is written with :meth:`write_theme`
+
+        :param values: Maps `AppsUseLightTheme` and/or `SystemUsesLightTheme` to 0 for dark mode or 1 for light mode
+        :type values: dict
+        :return: None
+        :rtype: None
+        """
+        for name, value in values.items():
+            self.write_theme(name, value)
+
+    def theme_notifier(self):
+        """
+        :return: A notifier whose ``start(callback)`` method arranges for ``callback`` to be called whenever the
+            `Personalize` registry key changes. See :mod:`themeswitch.themestate`
+        :rtype: object
+        """
+        raise NotImplementedError
+
+    def get_brightness(self):
+        """
+        :return: Current brightness level within the range 0-100
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def set_brightness(self, value):
+        """
+        :param value: A number within the range 0-100
+        :type value: int
+        :return: None
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    def get_wallpaper(self):
+        """
+        :return: Path to the current wallpaper
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def set_wallpaper(self, path):
+        """
+        :param path: Path to the image file that will be set as wallpaper
+        :type path: str
+        :return: None
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    def get_screen_size(self):
+        """
+        :return: Resolution of the primary screen in physical pixels, as ``(width, height)``
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+    def run_command(self, command):
+        """
+        Run ``command`` in a shell and wait for it to finish
+
+        :param command: Command line to run, for example a `SCHTASKS` invocation
+        :type command: str
+        :return: Everything the command wrote to stdout
+        :rtype: str
+        """
+        raise NotImplementedError
+
+
+class WindowsBackend(Backend):
+    """
+    Backend that talks to Windows through `winreg`, `wmi` and `ctypes`. The Windows-only modules are imported when
+    the backend is created, not when this module is imported. Brightness goes through a single
+    :class:`themeswitch.brightness.BrightnessController` and the registry through a single
+    :class:`themeswitch.registry.RegistrySession`, both living as long as the backend.
+    """
+
+    def __init__(self):
+        import ctypes
+        import winreg
+        import pythoncom
+        import pywintypes
+        import wmi
+        self._ctypes = ctypes
+        self._winreg = winreg
+        self._registry = RegistrySession(winreg, PERSONALIZE_KEY)
+        self._brightness = BrightnessController(lambda: wmi.WMI(namespace='wmi'),
+                                                stale_errors=(pywintypes.com_error, wmi.x_wmi),
+                                                initializer=pythoncom.CoInitialize)
+
+    def read_theme(self, name):
+        return self._registry.read(name)
+
+    def write_theme(self, name, value):
+        self._registry.write({name: value})
+
+    def write_themes(self, values):
+        self._registry.write(values)
+
+    def theme_notifier(self):
+        return RegistryNotifier(self._winreg, self._ctypes, PERSONALIZE_KEY,
+                                fallback=PollingNotifier(self.read_theme, (APPS_THEME, SYSTEM_THEME)))
+
+    def get_brightness(self):
+        return self._brightness.get()
+
+    def set_brightness(self, value):
+        self._brightness.set(value)
+
+    def get_wallpaper(self):
+        buffer = self._ctypes.create_unicode_buffer(MAX_PATH)
+        self._ctypes.windll.user32.SystemParametersInfoW(SPI_GETDESKWALLPAPER, MAX_PATH, buffer, 0)
+        return buffer.value
+
+    def set_wallpaper(self, path):
+        self._ctypes.windll.user32.SystemParametersInfoW(SPI_SETDESKWALLPAPER, 0, path, 0)
+
+    def get_screen_size(self):
+        # GetDeviceCaps reports physical pixels even when the process isn't DPI aware, unlike GetSystemMetrics
+        user32, gdi32 = self._ctypes.windll.user32, self._ctypes.windll.gdi32
+        hdc = user32.GetDC(0)
+        try:
+            return gdi32.GetDeviceCaps(hdc, DESKTOPHORZRES), gdi32.GetDeviceCaps(hdc, DESKTOPVERTRES)
+        finally:
+            user32.ReleaseDC(0, hdc)
+
+    def run_command(self, command):
+        with os.popen(command) as pipe:
+            return pipe.read()
+
+
+class FakeTaskScheduler:
+    """
+    In-memory stand-in for the `SCHTASKS` command line. Only the invocations issued by Theme Switch are understood.
+    Task names are compared case-insensitively, like Task Scheduler does.
+    """
+
+    _name = re.compile(r'/TN "\\?Theme Switch\\([^"]*)"', re.IGNORECASE)
+    _start = re.compile(r'/ST (\d{2}:\d{2})', re.IGNORECASE)
+
+    def __init__(self, date="18/10/2026"):
+        self.date = date
+        self.tasks = {}
+
+    def add(self, name, start_time, enabled=True):
+        """
+        Register a task directly, as if it had been created earlier
+
+        :param name: Name of the task inside the `Theme Switch` folder
+        :type name: str
+        :param start_time: Daily start time in a 24 hours format `HH:MM`
+        :type start_time: str
+        :param enabled: Whether the task is enabled
+        :type enabled: bool
+        :return: None
+        :rtype: None
+        """
+        self.tasks[name.lower()] = {'name': name, 'start_time': start_time, 'enabled': enabled}
+
+    def csv_row(self, task):
+        next_run = f"{self.date} {task['start_time']}:00" if task['enabled'] else "N/A"
+        status = "Ready" if task['enabled'] else "Disabled"
+        return f'"\\Theme Switch\\{task["name"]}","{next_run}","{status}"\n'
+
+    def run(self, command):
+        """
+        Execute a `SCHTASKS` command line. Several commands can be chained with ``&``, like in `cmd.exe`
+
+        :param command: The command line
+        :type command: str
+        :return: What `SCHTASKS` would print to stdout
+        :rtype: str
+        """
+        return "".join(self._run(part) for part in command.split(" & "))
+
+    def _run(self, command):
+        match = self._name.search(command)
+        name = match.group(1) if match else ""
+        task = self.tasks.get(name.lower())
+        upper = command.upper()
+        if "/CREATE" in upper:
+            self.add(name, self._start.search(command).group(1))
+            return ""
+        if "/CHANGE" in upper:
+            if task is not None:
+                task['enabled'] = "/ENABLE" in upper
+            return ""
+        if "/QUERY" in upper:
+            if task is not None:
+                return self.csv_row(task)
+            if name == "":
+                return "".join(self.csv_row(t) for t in self.tasks.values())
+            return ""
+        raise ValueError(f"Unsupported command: {command}")
+
+
+class FakeBackend(Backend):
+    """
+    In-memory backend. Every operation is recorded in :attr:`calls` and can be slowed down to simulate a real system.
+
+    :param latency: Seconds to sleep on each operation. Either a single number for every operation or a dict mapping
+        method names (for example ``'set_brightness'``) to seconds
+    :type latency: float or dict
+    :param errors: Maps method names to an exception raised every time that method is called
+    :type errors: dict
+    """
+
+    def __init__(self, latency=None, errors=None):
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.themes = {APPS_THEME: 1, SYSTEM_THEME: 1}
+        self.brightness = 100
+        self.wallpaper = ""
+        self.screen_size = (1920, 1080)
+        self.scheduler = FakeTaskScheduler()
+        self.notifier = FakeNotifier()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, operation, *args):
+        with self._lock:
+            self.calls.append((operation,) + args)
+        delay = self.latency if isinstance(self.latency, (int, float)) else self.latency.get(operation, 0)
+        if delay:
+            time.sleep(delay)
+        if operation in self.errors:
+            raise self.errors[operation]
+
+    def count(self, operation):
+        """
+        :param operation: Name of a backend method
+        :type operation: str
+        :return: How many times ``operation`` has been called
+        :rtype: int
+        """
+        return sum(1 for call in self.calls if call[0] == operation)
+
+    def read_theme(self, name):
+        self._call('read_theme', name)
+        return self.themes[name]
+
+    def write_theme(self, name, value):
+        self._call('write_theme', name, value)
+        self.themes[name] = value
+
+    def write_themes(self, values):
+        self._call('write_themes', dict(values))
+        self.themes.update(values)
+
+    def theme_notifier(self):
+        return self.notifier
+
+    def get_brightness(self):
+        self._call('get_brightness')
+        return self.brightness
+
+    def set_brightness(self, value):
+        self._call('set_brightness', value)
+        self.brightness = value
+
+    def get_wallpaper(self):
+        self._call('get_wallpaper')
+        return self.wallpaper
+
+    def set_wallpaper(self, path):
+        self._call('set_wallpaper', path)
+        self.wallpaper = path
+
+    def get_screen_size(self):
+        self._call('get_screen_size')
+        return self.screen_size
+
+    def run_command(self, command):
+        self._call('run_command', command)
+        with self._lock:
+            return self.scheduler.run(command)
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived WMI brightness session.
+
+Connecting to the `root\\wmi` namespace and enumerating `WmiMonitorBrightnessMethods` is the slowest part of a switch,
+so :class:`BrightnessController` does it once and keeps the objects around. COM objects belong to the thread that
+created them, so every WMI call runs on a single dedicated thread owned by the controller.
+
+:class:`BrightnessPreview` shows brightness levels live while a slider moves, sending only the latest level at a
+capped rate.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BrightnessController:
+    """
+    Cached connection to the WMI brightness provider that reconnects when the session goes stale.
+
+    :param connect: Callable returning a connection to the `root\\wmi` namespace, for example
+        ``lambda: wmi.WMI(namespace='wmi')``
+    :type connect: callable
+    :param stale_errors: Exceptions that mean the connection is no longer usable. The controller reconnects once and
+        retries when one of them is raised
+    :type stale_errors: tuple
+    :param initializer: Callable run once on the WMI thread before connecting, for example ``pythoncom.CoInitialize``
+    :type initializer: callable
+    """
+
+    def __init__(self, connect, stale_errors=(Exception,), initializer=None):
+        self._connect = connect
+        self._stale_errors = stale_errors
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="brightness", initializer=initializer)
+        self._connection = None
+        self._methods = None
+        self.connects = 0
+
+    def _session(self):
+        if self._methods is None:
+            connection = self._connect()
+            self._methods = connection.WmiMonitorBrightnessMethods()[0]
+            self._connection = connection
+            self.connects += 1
+        return self._connection, self._methods
+
+    def _reset(self):
+        self._connection = None
+        self._methods = None
+
+    def _call(self, func):
+        def run():
+            try:
+                return func(*self._session())
+            except self._stale_errors as e:
+                logger.warning("WMI brightness session failed (%s). Reconnecting.", e)
+                self._reset()
+                return func(*self._session())
+        return self._executor.submit(run).result()
+
+    def set(self, value):
+        """
+        Change the brightness level
+
+        :param value: A number within the range 0-100
+        :type value: int
+        :return: None
+        :rtype: None
+        """
+        self._call(lambda connection, methods: methods.WmiSetBrightness(value, 0))
+
+    def get(self):
+        """
+        :return: Current brightness level within the range 0-100
+        :rtype: int
+        """
+        return self._call(lambda connection, methods: connection.WmiMonitorBrightness()[0].CurrentBrightness)
+
+    def close(self):
+        """
+        Drop the cached session and stop the WMI thread
+
+        :return: None
+        :rtype: None
+        """
+        self._executor.submit(self._reset)
+        self._executor.shutdown(wait=True)
+
+
+class BrightnessPreview:
+    """
+    Applies brightness levels as they are picked, on a worker thread. :meth:`show` only records the level, so it
+    never blocks the caller. The worker sends the latest recorded level at most once every ``min_interval`` seconds;
+    levels picked in between replace each other and are never sent. The level from before the preview is read first
+    and restored by :meth:`cancel`.
+    A preview is used once: after :meth:`commit` or :meth:`cancel`, :meth:`show` does nothing.
+
+    :param set_brightness: Callable taking a level within the range 0-100, for example
+        :meth:`themeswitch.backend.Backend.set_brightness`
+    :type set_brightness: callable
+    :param get_brightness: Callable returning the current level
+    :type get_brightness: callable
+    :param min_interval: Minimum seconds between two levels sent
+    :type min_interval: float
+    """
+
+    def __init__(self, set_brightness, get_brightness, min_interval=0.1):
+        self._set = set_brightness
+        self._get = get_brightness
+        self.min_interval = min_interval
+        self._condition = threading.Condition()
+        self._pending = None
+        self._thread = None
+        self._finished = False
+        self._restore = False
+        self.original = None
+        self.sent = []
+
+    def show(self, value):
+        """
+        Make ``value`` the next level to send
+
+        :param value: A number within the range 0-100
+        :type value: float
+        :return: None
+        :rtype: None
+        """
+        with self._condition:
+            if self._finished:
+                return
+            self._pending = round(float(value))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="brightness-preview", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _send(self, value):
+        try:
+            self._set(value)
+            self.sent.append(value)
+        except Exception:
+            logger.exception("Could not preview brightness level %s", value)
+
+    def _run(self):
+        try:
+            original = self._get()
+        except Exception:
+            logger.exception("Could not read the brightness level before the preview")
+            original = None
+        with self._condition:
+            self.original = original
+        last = float("-inf")
+        while True:
+            with self._condition:
+                if self._pending is None:
+                    if self._finished:
+                        break
+                    self._condition.wait()
+                    continue
+                delay = last + self.min_interval - time.monotonic()
+                if delay > 0 and not self._finished:
+                    self._condition.wait(delay)  # Levels picked meanwhile replace the pending one
+                    continue
+                value, self._pending = self._pending, None
+            self._send(value)
+            last = time.monotonic()
+        if self._restore and original is not None:
+            self._send(original)
+
+    def _finish(self, restore):
+        with self._condition:
+            if self._finished:
+                return
+            self._finished = True
+            self._restore = restore
+            if restore:
+                self._pending = None
+            self._condition.notify()
+
+    def commit(self):
+        """
+        End the preview and keep the last level picked. Doesn't wait for the worker
+
+        :return: None
+        :rtype: None
+        """
+        self._finish(restore=False)
+
+    def cancel(self):
+        """
+        End the preview and restore the level from before it. Doesn't wait for the worker
+
+        :return: None
+        :rtype: None
+        """
+        self._finish(restore=True)
+
+    def join(self, timeout=None):
+        """
+        Wait until the worker has sent everything
+
+        :param timeout: Seconds to wait at most
+        :type timeout: float
+        :return: None
+        :rtype: None
+        """
+        with self._condition:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class FakeComError(Exception):
+    """Raised by :class:`FakeWmiProvider` connections that have been expired."""
+
+
+class FakeWmiProvider:
+    """
+    Stand-in for ``wmi.WMI(namespace='wmi')``. Calling the provider opens a new connection, sleeping for
+    ``connect_latency`` seconds first. :meth:`expire` makes every open connection raise :class:`FakeComError`, like a
+    stale COM session.
+
+    :param connect_latency: Seconds each connection takes to open
+    :type connect_latency: float
+    :param brightness: Initial brightness level
+    :type brightness: int
+    """
+
+    def __init__(self, connect_latency=0, brightness=100):
+        self.connect_latency = connect_latency
+        self.brightness = brightness
+        self.connects = 0
+        self.set_calls = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.connects += 1
+        return _FakeWmiConnection(self, self.generation)
+
+    def expire(self):
+        """
+        Invalidate every connection opened so far
+
+        :return: None
+        :rtype: None
+        """
+        self.generation += 1
+
+
+class _FakeWmiConnection:
+    def __init__(self, provider, generation):
+        self._provider = provider
+        self._generation = generation
+
+    def _check(self):
+        if self._generation != self._provider.generation:
+            raise FakeComError("The RPC server is unavailable.")
+
+    def WmiMonitorBrightnessMethods(self):
+        self._check()
+        return [_FakeBrightnessMethods(self)]
+
+    def WmiMonitorBrightness(self):
+        self._check()
+        return [_FakeBrightness(self._provider.brightness)]
+
+
+class _FakeBrightnessMethods:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def WmiSetBrightness(self, brightness, timeout):
+        self._connection._check()
+        self._connection._provider.set_calls += 1
+        self._connection._provider.brightness = brightness
+
+
+class _FakeBrightness:
+    def __init__(self, brightness):
+        self.CurrentBrightness = brightness
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Hand work from background threads to the Tk thread.
+
+Tk may only be used from the thread running its main loop. The IPC listener, the tray icon, the scheduler and the
+switch workers post callables to a :class:`Dispatcher`, which the Tk thread drains with ``after``.
+"""
+
+import logging
+import queue
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Queue of callables run on the Tk thread. :meth:`post` can be called from any thread, also before :meth:`start`.
+
+    :param interval: Milliseconds between checks of the queue
+    :type interval: int
+    """
+
+    def __init__(self, interval=50):
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._widget = None
+
+    def post(self, func, *args):
+        """
+        Run ``func(*args)`` on the Tk thread
+
+        :param func: Callable to run
+        :type func: callable
+        :return: None
+        :rtype: None
+        """
+        self._queue.put((func, args))
+
+    def start(self, widget):
+        """
+        Start draining the queue. Must be called from the Tk thread
+
+        :param widget: Any widget of the Tk root
+        :type widget: :class:`tkinter.Misc`
+        :return: None
+        :rtype: None
+        """
+        self._widget = widget
+        self._poll()
+
+    def run_pending(self):
+        """
+        Run everything posted so far, on the calling thread
+
+        :return: None
+        :rtype: None
+        """
+        while True:
+            try:
+                func, args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Posted call %r failed", func)
+
+    def _poll(self):
+        self.run_pending()
+        self._widget.after(self.interval, self._poll)
@@ -6,18 +6,167 @@ Created on Tue Aug 18 07:01:40 2020
 @author: noerg
 """
 
-import ctypes
+import atexit
+import copy
+import datetime
 import os
-import winreg
-import wmi
-import yaml
+import queue
+import sys
+import threading
 import logging
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
+from themeswitch import instance, tasks
+from themeswitch.backend import WindowsBackend, APPS_THEME, SYSTEM_THEME
+from themeswitch.metrics import Metrics
+from themeswitch.profiling import Profiler, profile_path, sample_stacks, write_folded, SAMPLE_SECONDS
+from themeswitch.scheduler import Scheduler
+from themeswitch.solar import SolarTables
+from themeswitch.store import SettingsStore
+from themeswitch.themestate import ThemeState
+from themeswitch.thumbnails import ThumbnailCache
+from themeswitch.wallpaper import WallpaperCache
+from themeswitch.worker import SwitchQueue
+
+SETTINGS_FILE = Path(__file__).parent / "settings.yaml"
+WALLPAPER_CACHE_DIR = Path(__file__).parent / "cache" / "wallpapers"
+THUMBNAIL_CACHE_DIR = Path(__file__).parent / "cache" / "thumbnails"
+SOLAR_CACHE_DIR = Path(__file__).parent / "cache" / "solar"
+LOG_DIR = os.environ.get("THEMESWITCH_LOG_DIR") or Path(__file__).parent
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+METRICS_FILE = Path(LOG_DIR) / "metrics.log"
+INSTANCE_ADDRESS = instance.default_address()
+STEP_TIMEOUT = 10  # Seconds each step of a switch is allowed to take
+
+SwitchStep = namedtuple('SwitchStep', ['name', 'duration', 'error'])
+
+
+_listener = None
+_log_dir = None
+_log_rotate = None
+_log_lock = threading.Lock()
+
+
+class _RotatingFileHandler(RotatingFileHandler):
+    """
+    :class:`logging.handlers.RotatingFileHandler` that keeps appending when the file can't be rotated. Windows
+    doesn't allow renaming a file another process has open, which happens while a command line switch writes to
+    the same log. Rotation is then retried a minute later instead of on every record.
+    """
+
+    retry_interval = 60
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._retry_at = 0
+
+    def shouldRollover(self, record):
+        if time.monotonic() < self._retry_at:
+            return False
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError:
+            self._retry_at = time.monotonic() + self.retry_interval
+            if self.stream is None:
+                self.stream = self._open()
+
+
+def setup_logging(log_dir=None, level=logging.INFO, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUPS,
+                  rotate=False):
+    """
+    Send every record of the `themeswitch` loggers through a queue to a background thread that writes `full.log`
+    (INFO and above) and `app.log` (ERROR and above). Logging never waits for disk I/O.
+    Only the resident instance rotates the files by size. Short-lived processes, like a switch from the command line,
+    only append to them, so two processes never rotate the same file.
+    Calling this again with the same arguments does nothing; with a different directory, the files are moved there.
+
+    :param log_dir: Directory for the log files. Defaults to :data:`LOG_DIR`
+    :type log_dir: str
+    :param level: Lowest level of severity that is logged. Defaults to `logging.INFO`
+    :type level: int
+    :param max_bytes: Size at which a log file is rotated
+    :type max_bytes: int
+    :param backup_count: Number of rotated files kept for each log
+    :type backup_count: int
+    :param rotate: Rotate the files once they reach ``max_bytes``
+    :type rotate: bool
+    :return: None
+    :rtype: None
+    """
+    global _listener, _log_dir, _log_rotate
+    log_dir = Path(log_dir or LOG_DIR)
+    with _log_lock:
+        if _listener is not None and log_dir == _log_dir and rotate == _log_rotate:
+            return
+        log_dir.mkdir(parents=True, exist_ok=True)
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', "%Y-%m-%d %H:%M:%S")
+        handlers = []
+        for file_name, file_level in (("full.log", logging.INFO), ("app.log", logging.ERROR)):
+            if rotate:
+                handler = _RotatingFileHandler(log_dir / file_name, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding="utf-8")
+            else:
+                handler = logging.FileHandler(log_dir / file_name, encoding="utf-8")
+            handler.setLevel(file_level)
+            handlers.append(handler)
+        if sys.stderr is not None:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        package_logger = logging.getLogger("themeswitch")
+        for handler in list(package_logger.handlers):
+            if isinstance(handler, QueueHandler):
+                package_logger.removeHandler(handler)
+        _stop_listener()
+        records = queue.SimpleQueue()
+        package_logger.addHandler(QueueHandler(records))
+        package_logger.setLevel(level)
+        package_logger.propagate = False
+        _listener = QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        _log_dir, _log_rotate = log_dir, rotate
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+
+def flush_logs():
+    """
+    Wait until every record logged so far has been written
+
+    :return: None
+    :rtype: None
+    """
+    with _log_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def log_file():
+    """
+    :return: Path to `full.log`
+    :rtype: :class:`pathlib.Path`
+    """
+    return (_log_dir or Path(LOG_DIR)) / "full.log"
 
 
 def get_logger(name=__name__, level=logging.INFO):
     """Returns a :class:`logging.Logger` object.
-    Sets two handlers with different levels of severity to the created logger.
+    Logging is set up with :func:`setup_logging` the first time this is called; later calls don't add any handler.
+    Loggers outside the `themeswitch` package, like `__main__`, are placed under it so their records are kept too.
 
     :param name: Name of the logger. Defaults to ``__name__``
     :type name: str
@@ -26,66 +175,132 @@ def get_logger(name=__name__, level=logging.INFO):
     :return: A `logging.Logger` object using the provided name and level of severity
     :rtype: :class:`logging.Logger`
     """
-    logging.basicConfig(level=level)
-    logger = logging.getLogger(name)
-    c_handler = logging.FileHandler(Path(__file__).parent / "full.log")
-    f_handler = logging.FileHandler(Path(__file__).parent / "app.log")
-    c_handler.setLevel(logging.INFO)
-    f_handler.setLevel(logging.ERROR)
+    if _listener is None:
+        setup_logging(level=level)
+    if name != "themeswitch" and not name.startswith("themeswitch."):
+        name = "themeswitch." + name
+    return logging.getLogger(name)
 
-    c_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', "%Y-%m-%d %H:%M:%S")
-    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', "%Y-%m-%d %H:%M:%S")
-    c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
-
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
-    return logger
 
+atexit.register(_stop_listener)
 
 logger = get_logger(__name__)
 
+_metrics = None
+
+
+def get_metrics():
+    """
+    Return the metrics registry of this process, which saves its samples to :data:`METRICS_FILE`
+
+    :return: The metrics registry
+    :rtype: :class:`themeswitch.metrics.Metrics`
+    """
+    global _metrics
+    if _metrics is None or _metrics.path != METRICS_FILE:
+        _metrics = Metrics(METRICS_FILE)
+    return _metrics
+
+
+def _flush_metrics():
+    if _metrics is not None:
+        _metrics.flush()
+
+
+atexit.register(_flush_metrics)
+
+_backend = None
+
+
+def get_backend():
+    """
+    Return the backend used to reach the operating system. A :class:`themeswitch.backend.WindowsBackend` is created
+    the first time this function is called unless another backend was set with :func:`set_backend`.
+
+    :return: The active backend
+    :rtype: :class:`themeswitch.backend.Backend`
+    """
+    global _backend
+    if _backend is None:
+        _backend = WindowsBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Replace the backend used to reach the operating system, for example with a
+    :class:`themeswitch.backend.FakeBackend`. Passing ``None`` restores the default backend on next use.
+
+    :param backend: The new backend
+    :type backend: :class:`themeswitch.backend.Backend`
+    :return: The previous backend
+    :rtype: :class:`themeswitch.backend.Backend`
+    """
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def default_settings():
+    """
+    :return: The settings written to `settings.yaml` when the file is missing or corrupted
+    :rtype: dict
+    """
+    return {
+        "dark_mode": {
+            "brightness": 0,
+            "os_theme": 0,
+            "wallpaper": "",
+            "start_hour": "07",
+            "start_minute": "00",
+            "enable_schedule": False
+        },
+        "light_mode": {
+            "brightness": 100,
+            "os_theme": 1,
+            "wallpaper": "",
+            "start_hour": "19",
+            "start_minute": "00",
+            "enable_schedule": False
+        },
+        "solar": {
+            "enabled": False,
+            "latitude": 0.0,
+            "longitude": 0.0
+        },
+    }
+
+
+_store = None
+
+
+def get_store():
+    """
+    Return the :class:`themeswitch.store.SettingsStore` for :data:`SETTINGS_FILE`
+
+    :return: The settings store shared by the whole program
+    :rtype: :class:`themeswitch.store.SettingsStore`
+    """
+    global _store
+    if _store is None or _store.path != SETTINGS_FILE:
+        _store = SettingsStore(SETTINGS_FILE, default_settings, check_settings)
+    return _store
+
 
 def load_settings():
     """
-    Reads the contents of `settings.yaml` and returns them as a dictionary. If the file can't be found,
+    Returns the contents of `settings.yaml` as a dictionary. If the file can't be found,
     or the contents are not the ones expected by the program, a new file with default values is created.
+    The file is only parsed again when it changes, see :class:`themeswitch.store.SettingsStore`.
 
-    :raises FileNotFoundError: Raised when the file `settings.yaml` is not found.
-    The exception is handled by creating a new `settings.yaml` file with a default set of values
     :return: A dictionary with the contents of `settings.yaml` or default values.
     :rtype: dict
     """
-    logger.info("Attempting to read settings file")
-    try:
-        with open(Path(__file__).parent / "settings.yaml") as file:
-            settings = yaml.load(file, Loader=yaml.FullLoader)
-            if not check_settings(settings):
-                raise FileNotFoundError
-            logger.info("Settings recovered successfully")
-    except FileNotFoundError:
-        with open(Path(__file__).parent / "settings.yaml", "w") as file:
-            settings = {
-                "dark_mode": {
-                    "brightness": 0,
-                    "os_theme": 0,
-                    "wallpaper": "",
-                    "start_hour": "07",
-                    "start_minute": "00",
-                    "enable_schedule": False
-                },
-                "light_mode": {
-                    "brightness": 100,
-                    "os_theme": 1,
-                    "wallpaper": "",
-                    "start_hour": "19",
-                    "start_minute": "00",
-                    "enable_schedule": False
-                },
-            }
-            yaml.dump(settings, file)
-            logger.info("New settings file with default values created in %s", Path(__file__).parent / "settings.yaml")
-    return settings
+    store = get_store()
+    start = time.perf_counter()
+    if store.refresh():  # Only time actual parses, not the cached reads
+        get_metrics().record('settings.load', time.perf_counter() - start)
+    return store.get()
 
 
 def check_settings(settings):
@@ -101,9 +316,12 @@ def check_settings(settings):
     top_keys = ['dark_mode', 'light_mode']
     low_keys = ['brightness', 'enable_schedule', 'os_theme', 'start_hour', 'start_minute', 'wallpaper']
     try:
-        if list(settings.keys()) != top_keys:
+        # `solar` was added later, so files without it are still valid
+        if list(settings.keys()) not in (top_keys, top_keys + ['solar']):
             return False
-        for i, mode in enumerate(settings):
+        if 'solar' in settings and not check_solar_settings(settings['solar']):
+            return False
+        for i, mode in enumerate(top_keys):
             if list(settings[mode].keys()) != low_keys:
                 return False
             if any(value is None for value in settings[mode].values()):
@@ -122,17 +340,53 @@ def check_settings(settings):
         return False
 
 
+def check_solar_settings(solar):
+    """
+    :param solar: The `solar` section of `settings.yaml`
+    :type solar: dict
+    :return: True if it has a boolean `enabled` and a `latitude` and `longitude` within range
+    :rtype: bool
+    """
+    if not isinstance(solar, dict) or sorted(solar) != ['enabled', 'latitude', 'longitude']:
+        return False
+    if type(solar['enabled']) != bool:
+        return False
+    for key, limit in (('latitude', 90), ('longitude', 180)):
+        if type(solar[key]) not in (int, float) or not -limit <= solar[key] <= limit:
+            return False
+    return True
+
+
+_theme_state = None
+
+
+def get_theme_state():
+    """
+    Return the cache of theme values for the active backend. Values are read from the registry once and then only
+    after the registry reports a change.
+
+    :return: The theme state cache
+    :rtype: :class:`themeswitch.themestate.ThemeState`
+    """
+    global _theme_state
+    backend = get_backend()
+    if _theme_state is None or _theme_state.backend is not backend:
+        _theme_state = ThemeState(backend.read_theme, backend.theme_notifier())
+        _theme_state.backend = backend
+    return _theme_state
+
+
 def light_mode_is_on():
     """
-    Check the Windows registry and returns `1` if light mode is on
+    Check the Windows registry and returns `1` if light mode is on.
+    The value comes from :func:`get_theme_state`, so repeated checks don't touch the registry.
 
     :return: 1 if Windows light mode is on, 0 if not
     :rtype: bool
     """
-    key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, "Software\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                         access=winreg.KEY_READ | winreg.KEY_WOW64_32KEY)
-    logger.info("Light mode is on: %s", bool(winreg.EnumValue(key, 2)[1]))
-    return winreg.EnumValue(key, 2)[1]
+    value = get_theme_state().get(APPS_THEME)
+    logger.info("Light mode is on: %s", bool(value))
+    return value
 
 
 def change_brightness(value):
@@ -144,9 +398,7 @@ def change_brightness(value):
     :return: None
     :rtype: None
     """
-    c = wmi.WMI(namespace='wmi')
-    methods = c.WmiMonitorBrightnessMethods()[0]
-    methods.WmiSetBrightness(value, 0)
+    get_backend().set_brightness(value)
     logger.info("Brightness level set to %s", value)
 
 
@@ -159,10 +411,149 @@ def change_wallpaper(path_to_wallpaper):
     :return: None
     :rtype: None
     """
-    ctypes.windll.user32.SystemParametersInfoW(20, 0, path_to_wallpaper, 0)
+    get_backend().set_wallpaper(path_to_wallpaper)
     logger.info("Wallpaper set to %s", path_to_wallpaper)
 
 
+_wallpaper_cache = None
+
+
+def get_wallpaper_cache():
+    """
+    :return: The cache of pre-fitted wallpapers in :data:`WALLPAPER_CACHE_DIR`
+    :rtype: :class:`themeswitch.wallpaper.WallpaperCache`
+    """
+    global _wallpaper_cache
+    if _wallpaper_cache is None or _wallpaper_cache.directory != WALLPAPER_CACHE_DIR:
+        _wallpaper_cache = WallpaperCache(WALLPAPER_CACHE_DIR)
+    return _wallpaper_cache
+
+
+_thumbnail_cache = None
+
+
+_solar_tables = None
+
+
+def get_solar_tables():
+    """
+    :return: The sunrise and sunset tables in :data:`SOLAR_CACHE_DIR`
+    :rtype: :class:`themeswitch.solar.SolarTables`
+    """
+    global _solar_tables
+    if _solar_tables is None or _solar_tables.directory != SOLAR_CACHE_DIR:
+        _solar_tables = SolarTables(SOLAR_CACHE_DIR)
+    return _solar_tables
+
+
+SOLAR_EVENTS = {'light_mode': 'sunrise', 'dark_mode': 'sunset'}
+
+
+def next_solar_transition(location, mode, after):
+    """
+    :param location: ``(latitude, longitude)``
+    :type location: tuple
+    :param mode: `dark_mode`, which starts at sunset, or `light_mode`, which starts at sunrise
+    :type mode: str
+    :param after: Local time
+    :type after: :class:`datetime.datetime`
+    :return: Local time of the next sunset or sunrise, or None if there is none within a day or it can't be worked
+        out (for example when NumPy is missing)
+    :rtype: :class:`datetime.datetime`
+    """
+    try:
+        return get_solar_tables().next_event(location[0], location[1], SOLAR_EVENTS[mode], after)
+    except Exception as e:
+        logger.warning("Could not work out the next %s, using the fixed time: %r", SOLAR_EVENTS[mode], e)
+        return None
+
+
+def scheduled_settings(settings, now=None):
+    """
+    Return the settings with the start times the schedule uses next. With the `solar` settings enabled, the start
+    times of dark and light mode are replaced by the next sunset and sunrise; otherwise the settings are returned as
+    they are. A mode keeps its fixed time when there is no sunset or sunrise within a day.
+
+    :param settings: Dict containing the settings from settings.yaml
+    :type settings: dict
+    :param now: Local time to start from. Defaults to the current time
+    :type now: :class:`datetime.datetime`
+    :return: The settings to schedule with
+    :rtype: dict
+    """
+    solar = settings.get('solar')
+    if not solar or not solar['enabled']:
+        return settings
+    now = now or datetime.datetime.now()
+    settings = copy.deepcopy(settings)
+    for mode in SOLAR_EVENTS:
+        at = next_solar_transition((solar['latitude'], solar['longitude']), mode, now)
+        if at is not None:
+            settings[mode]['start_hour'] = "{0:02d}".format(at.hour)
+            settings[mode]['start_minute'] = "{0:02d}".format(at.minute)
+    return settings
+
+
+def get_thumbnail_cache():
+    """
+    :return: The cache of wallpaper previews in :data:`THUMBNAIL_CACHE_DIR`
+    :rtype: :class:`themeswitch.thumbnails.ThumbnailCache`
+    """
+    global _thumbnail_cache
+    if _thumbnail_cache is None or _thumbnail_cache.directory != THUMBNAIL_CACHE_DIR:
+        _thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR)
+    return _thumbnail_cache
+
+
+def prepare_wallpaper(path_to_wallpaper):
+    """
+    Return a copy of the wallpaper already fitted to the screen, so Windows doesn't have to decode and rescale the
+    original every time it's set. The copy is rendered the first time and then taken from the cache.
+    If the image can't be prepared for any reason (unreadable file, Pillow missing, an image too large to decode...),
+    the original path is returned, so the rest of the switch still runs.
+
+    :param path_to_wallpaper: Path to the image file that will be set as wallpaper
+    :type path_to_wallpaper: str
+    :return: Path to the image that should be handed to Windows
+    :rtype: str
+    """
+    if not path_to_wallpaper:
+        return path_to_wallpaper
+    try:
+        return str(get_wallpaper_cache().prepare(path_to_wallpaper, get_backend().get_screen_size()))
+    except Exception as e:
+        logger.warning("Could not prepare wallpaper %s, using the original: %r", path_to_wallpaper, e)
+        return path_to_wallpaper
+
+
+def missing_wallpapers(settings):
+    """
+    :param settings: Dict containing the settings from settings.yaml
+    :type settings: dict
+    :return: `dark_mode` and/or `light_mode`, for each mode that has no wallpaper set
+    :rtype: list
+    """
+    return [mode for mode in ('dark_mode', 'light_mode') if not settings[mode]['wallpaper']]
+
+
+def refresh_wallpaper_cache(settings):
+    """
+    Evict cached wallpapers that are no longer used by ``settings`` and render the ones that are missing.
+    Meant to be subscribed to the settings store.
+
+    :param settings: Dict containing the settings from settings.yaml
+    :type settings: dict
+    :return: None
+    :rtype: None
+    """
+    wallpapers = [settings[mode]['wallpaper'] for mode in ('dark_mode', 'light_mode') if settings[mode]['wallpaper']]
+    removed = get_wallpaper_cache().evict(wallpapers, get_backend().get_screen_size())
+    if removed:
+        logger.info("Removed %s cached wallpapers", removed)
+    for wallpaper in wallpapers:
+        prepare_wallpaper(wallpaper)
+
+
 def change_apps_theme(value):
     """
     Change to dark mode or light mode for apps
@@ -172,11 +563,7 @@ def change_apps_theme(value):
     :return: None
     :rtype: None
     """
-    key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, "Software\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                         0, winreg.KEY_SET_VALUE)
-    winreg.SetValueEx(key, "AppsUseLightTheme", 0, winreg.REG_DWORD, value)
-    winreg.CloseKey(key)
-    logger.info("Changed apps theme to %s", "dark mode" if value==0 else "light mode")
+    change_theme({APPS_THEME: value})
 
 
 def change_system_theme(value):
@@ -188,11 +575,24 @@ def change_system_theme(value):
     :return: None
     :rtype: None
     """
-    key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, "Software\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                         0, winreg.KEY_SET_VALUE)
-    winreg.SetValueEx(key, "SystemUsesLightTheme", 0, winreg.REG_DWORD, value)
-    winreg.CloseKey(key)
-    logger.info("Changed apps theme to %s", "dark mode" if value == 0 else "light mode")
+    change_theme({SYSTEM_THEME: value})
+
+
+def change_theme(values):
+    """
+    Change the apps and/or system theme with a single registry operation
+
+    :param values: Maps `AppsUseLightTheme` and/or `SystemUsesLightTheme` to 0 for dark mode or 1 for light mode
+    :type values: dict
+    :return: None
+    :rtype: None
+    """
+    get_backend().write_themes(values)
+    theme_state = get_theme_state()
+    for name, value in values.items():
+        theme_state.set(name, value)
+        logger.info("Changed %s theme to %s", "apps" if name == APPS_THEME else "system",
+                    "dark mode" if value == 0 else "light mode")
 
 
 def create_task(start_dark_mode=None, start_light_mode=None):
@@ -209,13 +609,11 @@ def create_task(start_dark_mode=None, start_light_mode=None):
     :rtype: None
     """
     if start_dark_mode:
-        os.popen(r'SCHTASKS /CREATE /SC DAILY /TN "Theme Switch\Change to Dark Mode" /TR ' +
-        r'"{0} -d" /ST {1} /F'.format(Path(__file__).parent / "..\TSwitch.exe", start_dark_mode))
+        get_backend().run_command(tasks.create_command('dark_mode', start_dark_mode))
         logger.info("Task scheduled: 'Change to Dark Mode' at %s", start_dark_mode)
 
     if start_light_mode:
-        os.popen(r'SCHTASKS /CREATE /SC DAILY /TN "Theme Switch\Change to Light Mode" /TR ' +
-                 r'"{0} -l" /ST {1} /F'.format(Path(__file__).parent / "..\TSwitch.exe", start_light_mode))
+        get_backend().run_command(tasks.create_command('light_mode', start_light_mode))
         logger.info("Task scheduled: 'Change to Light Mode' at %s", start_light_mode)
 
 
@@ -231,29 +629,164 @@ def change_task_state(i, state):
     :rtype: None
     """
     if i == 0:
-        os.popen(r'SCHTASKS /CHANGE /TN "Theme Switch\Change to Dark Mode" /{0}'.format(state))
+        get_backend().run_command(tasks.change_command('dark_mode', state))
         logger.info("Task changed: 'Change to Dark Mode' set to %s", state)
     elif i == 1:
-        os.popen(r'SCHTASKS /CHANGE /TN "Theme Switch\Change to Light Mode" /{0}'.format(state))
+        get_backend().run_command(tasks.change_command('light_mode', state))
         logger.info("Task changed: 'Change to Light Mode' set to %s", state)
 
 
-def task_exists(task_name):
+class SwitchResult:
+    """
+    Outcome of :func:`change_sys_theme`.
+
+    :param steps: One :class:`SwitchStep` per step, with its duration in seconds and the exception it raised, if any
+    :type steps: list
+    :param duration: Wall-clock time of the whole switch in seconds
+    :type duration: float
+    :param skipped: Names of the steps that were not run because their value was already set
+    :type skipped: list
     """
-    Check if a task named ``task_name`` exists in Windows Task Scheduler
 
-    :param task_name: Name of the task to check. Can be either `Change to Dark Mode` or `Change to Light Mode`
-    :type task_name: str
-    :return: False if task doesn't exists. True if it does
-    :rtype: bool
+    def __init__(self, steps, duration, skipped=()):
+        self.steps = steps
+        self.duration = duration
+        self.skipped = list(skipped)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    @property
+    def failed(self):
+        return [step for step in self.steps if step.error is not None]
+
+    def __repr__(self):
+        return "SwitchResult({0}, duration={1:.3f}, skipped={2})".format(self.steps, self.duration, self.skipped)
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="switch")
+    return _executor
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+
+def _measured(name, func, *args):
+    with get_metrics().span(name):
+        return func(*args)
+
+
+def run_steps(steps, timeout=STEP_TIMEOUT):
     """
-    return not os.popen('schtasks /query /TN "Theme Switch\{0}" >NUL 2>&1 || echo error'.format(
-            task_name)).read().strip() == "error"
+    Run independent steps at the same time on the switch worker pool and wait for all of them.
+    A step that raises or takes longer than ``timeout`` is reported as failed without stopping the others.
+
+    :param steps: Maps each step name to a tuple ``(function, *args)``
+    :type steps: dict
+    :param timeout: Seconds each step is allowed to take
+    :type timeout: float
+    :return: The duration and error of every step
+    :rtype: :class:`SwitchResult`
+    """
+    start = time.perf_counter()
+    futures = {name: _get_executor().submit(_timed, *step) for name, step in steps.items()}
+    done, _ = wait(futures.values(), timeout=timeout)
+    results = []
+    for name, future in futures.items():
+        if future in done:
+            duration, error = future.result()
+        else:
+            duration, error = timeout, TimeoutError("Step did not finish within {0} seconds".format(timeout))
+        if error is not None:
+            logger.error("Step %s failed: %r", name, error)
+        results.append(SwitchStep(name, duration, error))
+    return SwitchResult(results, time.perf_counter() - start)
+
+
+def read_current_state(timeout=STEP_TIMEOUT):
+    """
+    Read the current brightness, wallpaper and both theme values concurrently.
+    Values that can't be read are left out of the returned dictionary.
 
+    :param timeout: Seconds each read is allowed to take
+    :type timeout: float
+    :return: A dictionary with the keys `brightness`, `wallpaper`, `apps_theme` and `system_theme`
+    :rtype: dict
+    """
+    backend = get_backend()
+    theme_state = get_theme_state()
+    reads = {
+        'brightness': (backend.get_brightness,),
+        'wallpaper': (backend.get_wallpaper,),
+        'apps_theme': (theme_state.get, APPS_THEME),
+        'system_theme': (theme_state.get, SYSTEM_THEME),
+    }
+    futures = {name: _get_executor().submit(*read) for name, read in reads.items()}
+    done, _ = wait(futures.values(), timeout=timeout)
+    state = {}
+    for name, future in futures.items():
+        if future in done and future.exception() is None:
+            state[name] = future.result()
+        else:
+            logger.warning("Could not read current %s. It will be set anyway.", name)
+    return state
+
+
+def _same_path(a, b):
+    return os.path.normcase(os.path.normpath(a or '.')) == os.path.normcase(os.path.normpath(b or '.'))
+
+
+def plan_switch(brightness, wallpaper, os_theme, state):
+    """
+    Build the minimal list of steps needed to go from ``state`` to the given values
 
-def change_sys_theme(brightness, wallpaper, os_theme, **kwargs):
+    :param brightness: Brightness level. A number within the range 0-100
+    :type brightness: int
+    :param wallpaper: Path to the image file that will be set as wallpaper
+    :type wallpaper: str
+    :param os_theme: 0 for dark mode, 1 for light mode
+    :type os_theme: int
+    :param state: Current values, as returned by :func:`read_current_state`
+    :type state: dict
+    :return: Maps each step that changes something to a tuple ``(function, *args)``
+    :rtype: dict
+    """
+    steps = {
+        'brightness': (change_brightness, brightness),
+        'wallpaper': (change_wallpaper, wallpaper),
+    }
+    unchanged = {
+        'brightness': state.get('brightness') == brightness,
+        'wallpaper': 'wallpaper' in state and _same_path(state['wallpaper'], wallpaper),
+    }
+    steps = {name: step for name, step in steps.items() if not unchanged[name]}
+    # Both theme values live in the same registry key and are written together as one step
+    themes = {name: os_theme for key, name in (('apps_theme', APPS_THEME), ('system_theme', SYSTEM_THEME))
+              if state.get(key) != os_theme}
+    if themes:
+        steps['theme'] = (change_theme, themes)
+    return steps
+
+
+def change_sys_theme(brightness, wallpaper, os_theme, force=False, timeout=STEP_TIMEOUT, **kwargs):
     """
     Set brightness, wallpaper, system theme and apps theme to given values.
+    The wallpaper is replaced by a copy fitted to the screen, see :func:`prepare_wallpaper`.
+    The current values are read first and only the steps that change something are run, unless ``force`` is set.
+    The steps don't depend on each other and run concurrently, so one failing step doesn't stop the rest.
     For example:
     >> change_sys_theme(80, "path/to/wallpaper.jpg", 1)
 
@@ -265,13 +798,163 @@ def change_sys_theme(brightness, wallpaper, os_theme, **kwargs):
     :type wallpaper: str
     :param os_theme: 0 for dark mode, 1 for light mode
     :type os_theme: int
-    :return: None
-    :rtype: None
+    :param force: Run every step even if its value is already set
+    :type force: bool
+    :param timeout: Seconds each step is allowed to take
+    :type timeout: float
+    :return: The duration and error of every step that was run
+    :rtype: :class:`SwitchResult`
+    """
+    metrics = get_metrics()
+    start = time.perf_counter()
+    prepared = _get_executor().submit(_measured, 'switch.prepare_wallpaper', prepare_wallpaper, wallpaper)
+    state = {} if force else _measured('switch.read_state', read_current_state, timeout)
+    wallpaper = prepared.result()
+    steps = plan_switch(brightness, wallpaper, os_theme, state)
+    themes = steps['theme'][1] if 'theme' in steps else {}
+    skipped = [name for name in ('brightness', 'wallpaper') if name not in steps]
+    skipped += [key for key, name in (('apps_theme', APPS_THEME), ('system_theme', SYSTEM_THEME))
+                if name not in themes]
+    if skipped:
+        logger.info("Already set, skipping: %s", ", ".join(skipped))
+    result = run_steps(steps, timeout)
+    result = SwitchResult(result.steps, time.perf_counter() - start, skipped)
+    for step in result.steps:
+        metrics.record('switch.' + step.name, step.duration, step.error is None)
+    metrics.record('switch.total', result.duration, result.ok)
+    metrics.flush()
+    return result
+
+
+def switch_to_mode(mode, force=False):
+    """
+    Apply the values of a mode from the current settings
+
+    :param mode: `dark_mode` or `light_mode`
+    :type mode: str
+    :param force: Run every step even if its value is already set
+    :type force: bool
+    :return: The duration and error of every step that was run
+    :rtype: :class:`SwitchResult`
+    """
+    values = load_settings()[mode]
+    return change_sys_theme(values['brightness'], values['wallpaper'], values['os_theme'], force=force)
+
+
+def toggle_mode(force=False):
+    """
+    Change to Dark or Light mode, whichever is inactive
+
+    :param force: Run every step even if its value is already set
+    :type force: bool
+    :return: The duration and error of every step that was run
+    :rtype: :class:`SwitchResult`
+    """
+    mode = 'dark_mode' if light_mode_is_on() else 'light_mode'
+    logger.info("Changing to %s", mode)
+    return switch_to_mode(mode, force)
+
+
+_switch_queue = None
+
+
+def get_switch_queue():
+    """
+    :return: The queue every switch of the running instance goes through
+    :rtype: :class:`themeswitch.worker.SwitchQueue`
+    """
+    global _switch_queue
+    if _switch_queue is None:
+        _switch_queue = SwitchQueue()
+    return _switch_queue
+
+
+def queue_switch(mode, force=False, profile=False):
+    """
+    Switch on the switch queue and return right away. A request for a mode that is already queued or being applied
+    is collapsed into that one
+
+    :param mode: `dark_mode`, `light_mode` or `toggle`
+    :type mode: str
+    :param force: Run every step even if its value is already set
+    :type force: bool
+    :param profile: Profile the switch, see :func:`get_profiler`
+    :type profile: bool
+    :return: Future of the :class:`SwitchResult`
+    :rtype: :class:`concurrent.futures.Future`
+    """
+    func, args = (toggle_mode, (force,)) if mode == 'toggle' else (switch_to_mode, (mode, force))
+    if profile:
+        func, args = _profiled, ('switch-' + mode, func) + args
+    return get_switch_queue().submit(mode, func, *args)
+
+
+def get_profiler(label):
+    """
+    :param label: What is profiled, used in the file names
+    :type label: str
+    :return: A profiler writing its files next to `full.log`
+    :rtype: :class:`themeswitch.profiling.Profiler`
+    """
+    return Profiler(log_file().parent, label)
+
+
+def _profiled(label, func, *args):
+    with get_profiler(label):
+        return func(*args)
+
+
+def sample_process(duration=SAMPLE_SECONDS):
+    """
+    Sample the stacks of every thread of this process for ``duration`` seconds on a background thread, and write them
+    next to `full.log` in the folded format of flame graph tools
+
+    :param duration: Seconds to sample for
+    :type duration: float
+    :return: Path of the file that is written once sampling is done
+    :rtype: str
+    """
+    path = profile_path(log_file().parent, "resident", ".folded")
+
+    def run():
+        write_folded(path, sample_stacks(duration))
+        logger.info("Stack samples written to %s", path)
+    threading.Thread(target=run, name="stack-sampler", daemon=True).start()
+    return path
+
+
+def describe_switch(future):
+    """
+    :param future: A finished request of the switch queue
+    :type future: :class:`concurrent.futures.Future`
+    :return: Short text telling the user how the switch went
+    :rtype: str
+    """
+    error = future.exception()
+    if error is not None:
+        return "Could not change mode: {0}".format(error)
+    mode = "Light mode" if light_mode_is_on() else "Dark mode"
+    failed = future.result().failed
+    if failed:
+        return "{0} on, but could not change: {1}".format(mode, ", ".join(step.name for step in failed))
+    return "{0} on".format(mode)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """
+    Return the in-process scheduler, which switches modes at the scheduled times while the program is running.
+    It is empty until :meth:`themeswitch.scheduler.Scheduler.update` is called with the settings.
+
+    :return: The scheduler
+    :rtype: :class:`themeswitch.scheduler.Scheduler`
     """
-    change_brightness(brightness)
-    change_wallpaper(wallpaper)
-    change_apps_theme(os_theme)
-    change_system_theme(os_theme)
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(lambda mode: queue_switch(mode).result(), sun=next_solar_transition)
+    return _scheduler
 
 
 def check_tasks(settings):
@@ -279,45 +962,18 @@ def check_tasks(settings):
     Check if the status of the scheduled tasks is the same in Task Scheduler and in the setting files.
     If the tasks do not exists or have a different configuration than in the settings file, they will be updated to
     correct their status and properties.
+    The `Theme Switch` folder is queried once and every correction is applied in a single batch.
     This function will not run until the user has enabled scheduling at least once.
+    With the `solar` settings enabled, the tasks are set to the next sunset and sunrise, see
+    :func:`scheduled_settings`, so each check moves them to that day's times.
 
     :param settings: Dict containing the settings from settings.yaml
     :type settings: dict
     :return: None
     :rtype: None
     """
-    tasknames = ("Change to Dark mode", "Change to Light mode")
-    modes = ("dark_mode", "light_mode")
-    for i, task_mode in enumerate(zip(tasknames, modes)):
-        task_start_time = f"{settings[task_mode[1]]['start_hour']}:{settings[task_mode[1]]['start_minute']}" # Get the task start time from settings
-        if not task_exists(task_mode[0]) and settings[task_mode[1]]['enable_schedule']:
-            # Create a new task if it doesn't exist in task scheduler
-            start_time = [None, None]
-            start_time[i] = task_start_time
-            create_task(*start_time)
-            logger.warning("Task %s did not exist in Task Scheduler although it was not deleted by this program."
-                           " The task has been created again.", task_mode[0])
-        elif task_exists(task_mode[0]):
-            # If the task does exist, check if its status and properties are the same ones as in the settings file
-            query = os.popen(r'schtasks /query /TN "Theme Switch\{0}" /fo CSV /nh'.format(task_mode[0]))
-            output = query.readline().strip().replace('"', '')
-            output = output.split(',')
-            task_enabled = output[-1] == "Ready"
-            time = output[-2].strip().split(" ")  # Current next run time for the task
-            correct_state = settings[task_mode[1]]['enable_schedule']
-            if task_enabled == correct_state and time[-1][:-3] == task_start_time:
-                continue
-            elif time[-1] != "N/A" and time[1][:-3] != task_start_time:
-                start_time = [None, None]
-                start_time[i] = task_start_time
-                create_task(*start_time)
-                logger.warning("Task %s next run time has been corrected to %s", task_mode[0], start_time[i])
-                check_tasks(settings)
-            if task_enabled != correct_state:
-                state = "ENABLE" if correct_state else "DISABLE"
-                change_task_state(i, state)
-                logger.warning("Task %s status has been corrected to %s", task_mode[0], state)
-                check_tasks(settings)
-    # Call check_tasks again because:
-    #     - The function can't check if a task is disabled and if its next run time is correct at the same time
-    #     - If the tasks do not exists, they are created and are enable no matter what the settings file config is
+    with get_metrics().span('tasks.reconcile'):
+        corrections = tasks.reconcile(scheduled_settings(settings), get_backend().run_command)
+    get_metrics().flush()
+    for correction in corrections:
+        logger.warning(correction)
@@ -9,12 +9,13 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.filedialog import askopenfilename
 from tkinter.scrolledtext import ScrolledText, Scrollbar
-from PIL import Image, ImageTk
-from themeswitch import functions
-import yaml
+from PIL import ImageTk
+from themeswitch import assets, functions, thumbnails
+from themeswitch.brightness import BrightnessPreview
+from themeswitch.logtail import LogReader
+from themeswitch.store import SettingsWriter
 import webbrowser
 import os
-import pyperclip
 from pathlib import Path
 
 
@@ -41,16 +42,23 @@ class Base:
         y = (hs / 2) - (h / 2)  # Program y axis
         self.parent.geometry('{0}x{1}+{2}+{3}'.format(w, h, int(x), int(y)))
 
-    def load_theme(self):
+    def load_theme(self, name=None):
         """
-        Load dark and light themes and allow the program to access them
+        Allow the program to access the dark and light themes, and load theme ``name`` if given.
+        The theme packages are registered once per Tk interpreter and each theme is only sourced the first time
+        it's used, so opening more windows doesn't load anything again.
 
+        :param name: `awdark`, `awlight` or None to only register the themes
+        :type name: str
         :return: None
         :rtype: None
         """
-        # Code based on https://stackoverflow.com/a/62934393
-        base_theme_dir = Path(__file__).parent / "awthemes-9.3.2/"
-        self.parent.tk.eval(f"""
+        root = self.parent._root()
+        loaded = root.__dict__.get('_themeswitch_themes')
+        if loaded is None:
+            # Code based on https://stackoverflow.com/a/62934393
+            base_theme_dir = Path(__file__).parent / "awthemes-9.3.2/"
+            self.parent.tk.eval(f"""
 set base_theme_dir "{base_theme_dir.as_posix()}"
 
 package ifneeded awthemes 9.3.2 \
@@ -62,24 +70,26 @@ package ifneeded awdark 7.7 \
 package ifneeded awlight 7.6 \
     [list source [file join $base_theme_dir awlight.tcl]]
                             """)
-        self.parent.tk.call("package", "require", "awdark")
-        self.parent.tk.call("package", "require", "awlight")
+            loaded = root.__dict__['_themeswitch_themes'] = set()
+        if name is not None and name not in loaded:
+            self.parent.tk.call("package", "require", name)
+            loaded.add(name)
 
 
 class MainWindow(Base):
+    SWITCH_POLL_INTERVAL = 50  # Milliseconds between checks of a running switch
+
     def __init__(self, parent):
         Base.__init__(self, parent)
         self.parent = parent
         self.style = ttk.Style()
 
-        self.img = ImageTk.PhotoImage
         self.canvas = tk.Canvas(self.parent)
         self.action_btn = ttk.Button(self.parent)
 
         Base.set_position(self, 200, 180)
         self.initialize_interface()
         self.get_active_mode()
-        self.check_wallpaper()
 
     def initialize_interface(self):
         menubar = tk.Menu(self.parent)
@@ -100,6 +110,7 @@ class MainWindow(Base):
         self.canvas.config(width=200,
                            height=150,)
         self.canvas.pack()
+        self.img_on_canvas = self.canvas.create_image(100, 75)
 
         self.action_btn.config(command=self.change_system_mode)
         self.action_btn.pack(fill=tk.BOTH)
@@ -113,51 +124,49 @@ class MainWindow(Base):
             self.apply_dark_theme()
 
     def change_system_mode(self):
-        if functions.light_mode_is_on():
-            mode = 'dark_mode'
-            self.apply_dark_theme()
-        else:
-            mode = 'light_mode'
-            self.apply_light_theme()
-        functions.change_sys_theme(**functions.load_settings()[mode])
+        # The switch runs on the switch queue; the Tk thread only checks on it, so the window keeps responding
+        self.action_btn.config(text="Switching\u2026", state=tk.DISABLED)
+        self.check_switch(functions.queue_switch('toggle'))
+
+    def check_switch(self, future):
+        if not future.done():
+            self.parent.after(self.SWITCH_POLL_INTERVAL, self.check_switch, future)
+            return
+        self.action_btn.config(state=tk.NORMAL)
+        # The theme shown is read back after the switch, not assumed before it
+        self.get_active_mode()
+        if future.exception() is not None or future.result().failed:
+            messagebox.showwarning("Switch incomplete", functions.describe_switch(future), parent=self.parent)
 
     def apply_dark_theme(self):
+        self.load_theme("awdark")
         self.style.theme_use("awdark")
         self.style.configure('TButton',
                              relief=tk.FLAT)
-        self.img = ImageTk.PhotoImage(file=Path(__file__).parent / "../icons/moon.png")
-        img_on_canvas = self.canvas.create_image(100, 75)
         self.canvas.configure(background='black', highlightbackground='black')
-        self.canvas.itemconfig(img_on_canvas, image=self.img)
+        self.canvas.itemconfig(self.img_on_canvas, image=assets.photo(self.parent, "moon.png"))
         self.action_btn.config(text="Dark mode on")
 
     def apply_light_theme(self):
+        self.load_theme("awlight")
         self.style.theme_use("awlight")
         self.style.configure('TButton',
                              relief=tk.FLAT)
-        self.img = ImageTk.PhotoImage(file=Path(__file__).parent / "../icons/sun.png")
-        img_on_canvas = self.canvas.create_image(100, 75)
         self.canvas.configure(background='white', highlightbackground='white')
-        self.canvas.itemconfig(img_on_canvas, image=self.img)
+        self.canvas.itemconfig(self.img_on_canvas, image=assets.photo(self.parent, "sun.png"))
         self.action_btn.config(text="Light mode on")
 
-    def check_wallpaper(self):
+    def warn_missing_wallpapers(self, modes):
         # Maybe there should be a way to turn this on or off?
-        with open(Path(__file__).parent / "settings.yaml") as file:
-            settings = yaml.load(file, Loader=yaml.FullLoader)
-            dark_wp_path = settings['dark_mode']['wallpaper'] or ''
-            light_wp_path = settings['light_mode']['wallpaper'] or ''
-            if dark_wp_path == '' and light_wp_path == '':
-                messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your dark and light mode settings.")
-                self.open_dark_mode_settings()
-            elif dark_wp_path == '':
-                messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your dark mode settings.")
-                self.open_dark_mode_settings()
-            elif light_wp_path == '':
-                messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your light mode settings.")
-                self.open_light_mode_settings()
-            else:
-                return
+        if modes == ['dark_mode', 'light_mode']:
+            messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your dark and light mode settings.")
+            self.open_dark_mode_settings()
+        elif modes == ['dark_mode']:
+            messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your dark mode settings.")
+            self.open_dark_mode_settings()
+        elif modes == ['light_mode']:
+            messagebox.showwarning("No wallpaper set", "Please select a wallpaper for your light mode settings.")
+            self.open_light_mode_settings()
 
     def open_about_window(self):
         new_window = tk.Toplevel(self.parent)
@@ -189,6 +198,8 @@ class Settings(Base):
         self.start_hour = tk.StringVar(), tk.StringVar()
         self.start_minute = tk.StringVar(), tk.StringVar()
         self.enable_scheduler = tk.BooleanVar(), tk.BooleanVar()
+        self.live_preview = tk.BooleanVar(value=False)
+        self.preview = None
 
         tab_control = ttk.Notebook(self.parent)
         self.tabs = {'dark_mode': ttk.Frame(tab_control),
@@ -199,10 +210,12 @@ class Settings(Base):
         self.spin_hour = [ttk.Spinbox(self.tabs['dark_mode']), ttk.Spinbox(self.tabs['light_mode'])]
         self.spin_minute = [ttk.Spinbox(self.tabs['dark_mode']), ttk.Spinbox(self.tabs['light_mode'])]
         self.wallpaper_tk_thumbnail = [ImageTk.PhotoImage, ImageTk.PhotoImage]
+        self.writer = SettingsWriter(functions.get_store())
 
         self.initialize_interface(tab_control)
         tab_control.select(self.tabs[tab])
-        Base.set_position(self, 275, 270)
+        Base.set_position(self, 275, 295)
+        self.parent.protocol("WM_DELETE_WINDOW", self.close)
 
     def initialize_interface(self, tab_control):
         self.read_settings()
@@ -236,7 +249,8 @@ class Settings(Base):
                       from_=0, to=100,
                       orient=tk.HORIZONTAL,
                       variable=self.brightness_scale[i],
-                      command=self.whole_values_only).grid(row=1, column=1, columnspan=2, sticky="ew")
+                      command=lambda value, i=i: self.whole_values_only(i, value)).grid(row=1, column=1,
+                                                                                        columnspan=2, sticky="ew")
             ttk.Spinbox(self.tabs[tab],
                         textvariable=self.brightness_scale[i],
                         from_=0, to=100,
@@ -268,6 +282,10 @@ class Settings(Base):
                             text="Enable task scheduling",
                             variable=self.enable_scheduler[i],
                             command=lambda i=i: self.update_spin(i)).grid(row=3, column=0, columnspan=5)
+            ttk.Checkbutton(self.tabs[tab],
+                            text="Preview brightness while dragging",
+                            variable=self.live_preview,
+                            command=self.toggle_preview).grid(row=4, column=0, columnspan=5)
 
             ttk.Button(self.tabs[tab],
                        text="Apply",
@@ -280,18 +298,18 @@ class Settings(Base):
             self.wallpaper_path[i].set(path)
             self.preview_img_on_canvas(path, i)
 
-    def check_wallpaper_size(self, image):
-        if image.size[0] < self.parent.winfo_screenwidth() and image.size[1] < self.parent.winfo_screenheight():
+    def check_wallpaper_size(self, size):
+        if size[0] < self.parent.winfo_screenwidth() and size[1] < self.parent.winfo_screenheight():
             messagebox.showwarning("Warning: Image resolution too low.",
                                    "The resolution of the selected image is too low. For better results, select an "
                                    f"image with a resolution higher than {self.parent.winfo_screenwidth()}x{self.parent.winfo_screenheight()}",
                                    parent=self.parent)
-        elif image.size[0] < self.parent.winfo_screenwidth():
+        elif size[0] < self.parent.winfo_screenwidth():
             messagebox.showwarning("Warning: Image width too low",
                                    "The width of the selected image is too low. "
                                    "To avoid black bars or a blurry wallpaper, select an image with a higher resolution.",
                                    parent=self.parent)
-        elif image.size[1] < self.parent.winfo_screenheight():
+        elif size[1] < self.parent.winfo_screenheight():
             messagebox.showwarning("Warning: Image height too low.",
                                    "The height of the selected image is too low. "
                                    "To avoid black bars or a blurry wallpaper, select an image with a higher resolution.",
@@ -306,10 +324,10 @@ class Settings(Base):
         else:
             try:
                 self.preview_canvas[i].delete('placeholder_text')
-                img = Image.open(img_path)
-                self.check_wallpaper_size(img)
-                img.thumbnail((128, 96))
-                preview_img = self.preview_canvas[i].create_image(64, 32)
+                self.check_wallpaper_size(thumbnails.image_size(img_path))
+                img = functions.get_thumbnail_cache().get(img_path)
+                self.preview_canvas[i].delete('preview')
+                preview_img = self.preview_canvas[i].create_image(64, 32, tag='preview')
                 self.wallpaper_tk_thumbnail[i] = ImageTk.PhotoImage(img)
 
                 self.preview_canvas[i].itemconfig(preview_img,
@@ -318,42 +336,61 @@ class Settings(Base):
                 messagebox.showerror("Error", "Wallpaper path is invalid.", parent=self.parent)
                 self.preview_img_on_canvas("", i)
 
-    def whole_values_only(self, e):
-        for i in [0, 1]:
-            value = self.brightness_scale[i].get()
-            self.brightness_scale[i].set(round(value))
+    def whole_values_only(self, i, value):
+        self.brightness_scale[i].set(round(float(value)))
+        if self.live_preview.get():
+            if self.preview is None:
+                backend = functions.get_backend()
+                self.preview = BrightnessPreview(backend.set_brightness, backend.get_brightness)
+            # Only records the level; the preview sends the latest one at a capped rate on its own thread
+            self.preview.show(value)
+
+    def end_preview(self, keep):
+        if self.preview is not None:
+            if keep:
+                self.preview.commit()
+            else:
+                self.preview.cancel()
+            self.preview = None
+
+    def toggle_preview(self):
+        if not self.live_preview.get():
+            self.end_preview(keep=False)
 
     def save_settings(self):
-        with open(Path(__file__).parent / "settings.yaml", "r+") as file:
-            settings = yaml.load(file, Loader=yaml.FullLoader)
-        with open(Path(__file__).parent / "settings.yaml", "w") as file:
-            for i, mode in enumerate(['dark_mode', 'light_mode']):
-                settings[mode]['brightness'] = self.brightness_scale[i].get()
-                if self.wallpaper_path[i].get():
-                    settings[mode]['wallpaper'] = self.wallpaper_path[i].get()
-                settings[mode]['start_hour'] = self.start_hour[i].get()
-                settings[mode]['os_theme'] = i
-                settings[mode]['start_minute'] = self.start_minute[i].get()
-                settings[mode]['enable_schedule'] = self.enable_scheduler[i].get()
-            yaml.dump(settings, file)
+        # Edits stay in the dialog until Apply. The writer only writes the file if something actually changed.
+        settings = functions.load_settings()
+        for i, mode in enumerate(['dark_mode', 'light_mode']):
+            settings[mode]['brightness'] = self.brightness_scale[i].get()
+            if self.wallpaper_path[i].get():
+                settings[mode]['wallpaper'] = self.wallpaper_path[i].get()
+            settings[mode]['start_hour'] = self.start_hour[i].get()
+            settings[mode]['os_theme'] = i
+            settings[mode]['start_minute'] = self.start_minute[i].get()
+            settings[mode]['enable_schedule'] = self.enable_scheduler[i].get()
+        self.writer.update(settings)
+        return settings
+
+    def close(self):
+        self.end_preview(keep=False)
+        try:
+            self.writer.flush()
+        except ValueError:
+            pass  # Already reported when Apply was pressed; the dialog must still close
+        self.parent.destroy()
 
     def read_settings(self):
-        try:
-            with open(Path(__file__).parent / "settings.yaml") as file:
-                settings = yaml.load(file, Loader=yaml.FullLoader)
-                for i, mode in enumerate(['dark_mode', 'light_mode']):
-                    self.brightness_scale[i].set(settings[mode]['brightness'] or 0)
-                    self.wallpaper_path[i].set(settings[mode]['wallpaper'] or "")
-                    self.start_hour[i].set(settings[mode]['start_hour'] or '09')
-                    self.start_minute[i].set(settings[mode]['start_minute'] or '30')
-                    self.enable_scheduler[i].set(settings[mode]['enable_schedule'] or False)
-                    if not settings[mode]['enable_schedule']:
-                        self.spin_state[i] = tk.DISABLED
-                    else:
-                        self.spin_state[i] = 'readonly'
-        except FileNotFoundError:
-            functions.load_settings()
-            self.read_settings()
+        settings = functions.load_settings()
+        for i, mode in enumerate(['dark_mode', 'light_mode']):
+            self.brightness_scale[i].set(settings[mode]['brightness'] or 0)
+            self.wallpaper_path[i].set(settings[mode]['wallpaper'] or "")
+            self.start_hour[i].set(settings[mode]['start_hour'] or '09')
+            self.start_minute[i].set(settings[mode]['start_minute'] or '30')
+            self.enable_scheduler[i].set(settings[mode]['enable_schedule'] or False)
+            if not settings[mode]['enable_schedule']:
+                self.spin_state[i] = tk.DISABLED
+            else:
+                self.spin_state[i] = 'readonly'
 
     def update_spin(self, i):
         checked = self.enable_scheduler[i].get()
@@ -361,15 +398,15 @@ class Settings(Base):
         self.spin_minute[i].config(state='readonly' if checked else tk.DISABLED)
 
     def apply_changes(self):
-        self.save_settings()
-        for c, k in enumerate(["start_dark_mode", "start_light_mode"]):
-            settings = {"start_dark_mode": None, "start_light_mode": None}
-            settings[k] = f"{self.start_hour[c].get()}:{self.start_minute[c].get()}"
-            if self.enable_scheduler[c].get():
-                functions.change_task_state(c, "ENABLE")
-                functions.create_task(**settings)
-            else:
-                functions.change_task_state(c, "DISABLE")
+        settings = self.save_settings()
+        try:
+            self.writer.flush()
+        except ValueError:
+            messagebox.showerror("Error", "Some of the settings are invalid and were not saved.", parent=self.parent)
+            return
+        self.end_preview(keep=True)
+        # The scheduled tasks are brought in line with exactly what was saved, in one batch
+        functions.check_tasks(settings)
 
         messagebox.showinfo("Settings saved",
                             "Settings have been successfully updated and will be applied next time you switch modes.",
@@ -395,6 +432,9 @@ class About(Base):
         link.bind("<Button-1>", lambda event: webbrowser.open_new(event.widget.cget("text")))
 
 class Log(Base):
+    TAIL_LINES = 500  # Lines shown when the window opens, and loaded each time the view reaches the top
+    FOLLOW_INTERVAL = 1000  # Milliseconds between checks for new lines
+
     def __init__(self, parent):
         Base.__init__(self, parent)
         self.parent = parent
@@ -407,7 +447,7 @@ class Log(Base):
         self.log_box.bind("<Key>", lambda e: "break")
 
         bar.config(command=self.log_box.xview)
-        self.log_box.config(xscrollcommand=bar.set)
+        self.log_box.config(xscrollcommand=bar.set, yscrollcommand=self.on_scroll)
 
         self.log_box.grid(row=0, columnspan=2)
         bar.grid(row=1, column=0, sticky='nsew', columnspan=2)
@@ -417,12 +457,40 @@ class Log(Base):
         else:
             self.log_box.config(background='gray15', foreground="gray95")
         ttk.Button(self.frame, text="Click here to copy", command=self.copy_log_clipboard).grid(row=2, column=0, columnspan=3, sticky="WE")
+        self.reader = LogReader(functions.log_file())
         self.read_log()
+        self.parent.after(self.FOLLOW_INTERVAL, self.follow_log)
 
     def read_log(self):
-        with open(Path(__file__).parent / "full.log") as file:
-            self.text = file.readlines()
-            self.log_box.insert(tk.INSERT, ''.join(self.text))
+        self.log_box.insert(tk.END, self.reader.tail(self.TAIL_LINES))
+        self.log_box.see(tk.END)
+
+    def on_scroll(self, first, last):
+        self.log_box.vbar.set(first, last)
+        if float(first) == 0 and self.reader.has_older():
+            self.log_box.after_idle(self.read_older_log)
+
+    def read_older_log(self):
+        if not self.reader.has_older():
+            return
+        text = self.reader.older(self.TAIL_LINES)
+        self.log_box.insert("1.0", text)
+        self.log_box.yview_scroll(text.count("\n"), tk.UNITS)  # Keep the lines that were on screen in place
+
+    def follow_log(self):
+        if not self.parent.winfo_exists():
+            return
+        text, replaced = self.reader.follow()
+        at_bottom = self.log_box.yview()[1] == 1.0
+        if replaced:
+            self.log_box.delete("1.0", tk.END)
+        if text:
+            self.log_box.insert(tk.END, text)
+            if at_bottom:
+                self.log_box.see(tk.END)
+        self.parent.after(self.FOLLOW_INTERVAL, self.follow_log)
 
     def copy_log_clipboard(self):
-        pyperclip.copy(''.join(self.text))
\ No newline at end of file
+        self.parent.clipboard_clear()
+        for chunk in self.reader.chunks():
+            self.parent.clipboard_append(chunk)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Single-instance lock and command forwarding.
+
+The running instance listens on a local channel: a named pipe on Windows and a Unix socket elsewhere. Owning the
+listener is the lock. A later invocation first tries to connect, and if an instance answers it forwards its command
+(one of :data:`COMMANDS`) and exits instead of starting a second Tk root and tray icon.
+"""
+
+import getpass
+import logging
+import os
+import sys
+import tempfile
+import threading
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ('dark', 'light', 'toggle', 'open', 'reload-settings')
+PING = 'ping'
+OK = 'ok'
+TIMEOUT = 2.0  # Seconds to wait for the other side of a connection
+
+
+def default_address():
+    """
+    :return: Address of the channel of the current user: a named pipe on Windows, a Unix socket elsewhere
+    :rtype: str
+    """
+    if sys.platform == 'win32':
+        return r'\\.\pipe\ThemeSwitch-' + getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), "themeswitch-{0}.sock".format(os.getuid()))
+
+
+def forward(address, command, timeout=TIMEOUT):
+    """
+    Send ``command`` to the instance listening on ``address``
+
+    :param address: Address of the channel
+    :type address: str
+    :param command: Command and its options separated by spaces, for example ``"dark --force"``
+    :type command: str
+    :param timeout: Seconds to wait for the reply
+    :type timeout: float
+    :return: The reply of the instance, or None if no instance is running or it didn't reply in time
+    :rtype: str
+    """
+    try:
+        with Client(address) as conn:
+            conn.send_bytes(command.encode("utf-8"))
+            if not conn.poll(timeout):
+                logger.warning("The running instance didn't reply to '%s' within %s seconds.", command, timeout)
+                return None
+            return conn.recv_bytes().decode("utf-8")
+    except (OSError, EOFError):
+        return None
+
+
+class InstanceServer:
+    """
+    Listener of the running instance. Each connection carries one command, handled on the listener thread, so
+    ``handler`` must return quickly and hand long work off to another thread.
+
+    :param listener: Listener bound to the address
+    :type listener: :class:`multiprocessing.connection.Listener`
+    :param handler: Callable taking the command name and a list of its options, returning the reply
+    :type handler: callable
+    """
+
+    def __init__(self, listener, handler):
+        self._listener = listener
+        self._handler = handler
+        self.address = listener.address
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="instance-server", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError as e:
+                if self._closed:
+                    return
+                logger.warning("Failed to accept a forwarded command: %s", e)
+                continue
+            with conn:
+                if self._closed:  # The connection made by close() to wake this thread up
+                    return
+                try:
+                    self._serve(conn)
+                except (OSError, EOFError) as e:
+                    logger.warning("Dropped a forwarded command: %s", e)
+
+    def _serve(self, conn):
+        if not conn.poll(TIMEOUT):
+            raise EOFError("no command received")
+        command, *options = conn.recv_bytes().decode("utf-8").split() or [""]
+        if command == PING:
+            reply = OK
+        elif command in COMMANDS:
+            logger.info("Received forwarded command: %s", " ".join([command] + options))
+            try:
+                reply = self._handler(command, options) or OK
+            except Exception as e:
+                logger.exception("Forwarded command %s failed", command)
+                reply = "error: {0}".format(e)
+        else:
+            reply = "error: unknown command {0}".format(command)
+        conn.send_bytes(reply.encode("utf-8"))
+
+    def close(self):
+        """
+        Stop listening and release the lock
+
+        :return: None
+        :rtype: None
+        """
+        self._closed = True
+        # accept() doesn't return when the listener is closed from another thread, so wake it with a connection.
+        # Nothing is sent or read on it: the connection succeeds whether or not the thread is accepting yet.
+        try:
+            Client(self.address).close()
+        except OSError:
+            pass
+        self._thread.join()
+        self._listener.close()
+
+
+def acquire(address, handler):
+    """
+    Become the running instance
+
+    :param address: Address of the channel
+    :type address: str
+    :param handler: See :class:`InstanceServer`
+    :type handler: callable
+    :return: The server, or None if another instance is already running
+    :rtype: :class:`InstanceServer`
+    """
+    try:
+        listener = Listener(address)
+    except OSError:
+        if sys.platform == 'win32' or forward(address, PING) is not None:
+            return None
+        # Socket file left behind by an instance that didn't exit cleanly
+        os.unlink(address)
+        try:
+            listener = Listener(address)
+        except OSError:
+            return None
+    if sys.platform != 'win32':
+        os.chmod(address, 0o600)
+    return InstanceServer(listener, handler)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental reader for the log window.
+
+:class:`LogReader` never loads the whole log. It starts from the last lines of the file, reads older lines backwards
+on demand, and picks up lines appended since the last read, starting over when the file is rotated.
+"""
+
+import os
+
+BLOCK_SIZE = 64 * 1024
+
+
+class LogReader:
+    """
+    Reads a text file from the end.
+
+    :param path: Path to the log file
+    :type path: :class:`pathlib.Path`
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = None  # Offset of the oldest line read so far
+        self.end = 0  # Offset right after the newest line read so far
+        self._inode = None
+
+    @staticmethod
+    def _decode(data):
+        return data.decode("utf-8", errors="replace")
+
+    def _read_back(self, file, offset, lines):
+        """Return the offset where the last ``lines`` lines before ``offset`` begin."""
+        position = offset
+        found = 0
+        while position > 0:
+            size = min(BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            block = file.read(size)
+            if position + size == offset and block.endswith(b"\n"):
+                block = block[:-1]  # The newline that ends the line just before ``offset`` doesn't count
+            index = len(block)
+            while True:
+                index = block.rfind(b"\n", 0, index)
+                if index == -1:
+                    break
+                found += 1
+                if found == lines:
+                    return position + index + 1
+        return 0
+
+    def tail(self, lines=500):
+        """
+        Read the last ``lines`` lines of the file and remember where they start and end
+
+        :param lines: Number of lines to read
+        :type lines: int
+        :return: The text of those lines
+        :rtype: str
+        """
+        try:
+            with open(self.path, "rb") as file:
+                self._inode = os.fstat(file.fileno()).st_ino
+                end = file.seek(0, os.SEEK_END)
+                start = self._read_back(file, end, lines)
+                file.seek(start)
+                data = file.read(end - start)
+        except FileNotFoundError:
+            start, data = 0, b""
+        self.start, self.end = start, start + len(data)
+        return self._decode(data)
+
+    def has_older(self):
+        """
+        :return: True if there are lines before the oldest line read so far
+        :rtype: bool
+        """
+        return bool(self.start)
+
+    def older(self, lines=500):
+        """
+        Read up to ``lines`` lines before the oldest line read so far
+
+        :param lines: Number of lines to read
+        :type lines: int
+        :return: The text of those lines
+        :rtype: str
+        """
+        if not self.start:
+            return ""
+        with open(self.path, "rb") as file:
+            start = self._read_back(file, self.start, lines)
+            file.seek(start)
+            data = file.read(self.start - start)
+        self.start = start
+        return self._decode(data)
+
+    def follow(self):
+        """
+        Read the complete lines appended since the last read. If the file was rotated or truncated, the new file is
+        read from its beginning
+
+        :return: The new text, and True if the file was replaced and what was read before should be discarded
+        :rtype: tuple
+        """
+        try:
+            with open(self.path, "rb") as file:
+                st = os.fstat(file.fileno())
+                replaced = st.st_ino != self._inode or st.st_size < self.end
+                if replaced:
+                    self._inode, self.start, self.end = st.st_ino, 0, 0
+                file.seek(self.end)
+                data = file.read(st.st_size - self.end)
+        except FileNotFoundError:
+            return "", False
+        data = data[:data.rfind(b"\n") + 1]  # Leave a partly written line for the next read
+        self.end += len(data)
+        return self._decode(data), replaced
+
+    def chunks(self, size=BLOCK_SIZE):
+        """
+        Iterate over the whole file in blocks of text, without holding it all in memory
+
+        :param size: Bytes per block
+        :type size: int
+        :return: Blocks of text
+        :rtype: iterator
+        """
+        with open(self.path, encoding="utf-8", errors="replace") as file:
+            for block in iter(lambda: file.read(size), ""):
+                yield block
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Timing spans and failure counts.
+
+The steps of a switch, settings loads, task reconciliation and GUI startup are timed with :meth:`Metrics.span` or
+:meth:`Metrics.record`. The registry keeps counters and recent latencies of the current process, and every sample is
+also appended to a small text file shared by all processes, one line per sample::
+
+    <unix time> <name> <milliseconds> <1 if it succeeded, 0 if it failed>
+
+``themeswitch --stats`` reads that file back with :func:`read_samples` and prints :func:`report`.
+"""
+
+import collections
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = 256 * 1024  # Size at which the oldest half of the file is dropped
+HISTOGRAM_SIZE = 1000  # Latest latencies kept in memory per name
+
+Sample = collections.namedtuple("Sample", "time name duration ok")
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def percentile(samples, q):
+    """
+    Nearest-rank percentile of ``samples``
+
+    :param samples: Measured values
+    :type samples: list
+    :param q: Percentile within the range 0-100
+    :type q: float
+    :return: The value below which ``q`` percent of the samples fall
+    :rtype: float
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def parse_window(text):
+    """
+    :param text: A number followed by `s`, `m`, `h` or `d`, for example ``"24h"`` or ``"7d"``
+    :type text: str
+    :raises ValueError: If ``text`` isn't in that format
+    :return: The window in seconds
+    :rtype: float
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text.strip())
+    if not match:
+        raise ValueError("Invalid window {0!r}, expected for example 30m, 24h or 7d".format(text))
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+class Metrics:
+    """
+    Registry of the samples recorded by the current process.
+
+    :param path: File the samples are appended to by :meth:`flush`. Nothing is persisted if None
+    :type path: :class:`pathlib.Path`
+    :param clock: Callable returning the current Unix time
+    :type clock: callable
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(lambda: collections.deque(maxlen=HISTOGRAM_SIZE))
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, ok=True):
+        """
+        Record one sample
+
+        :param name: What was timed, for example `switch.brightness`
+        :type name: str
+        :param duration: Seconds it took
+        :type duration: float
+        :param ok: False if it failed
+        :type ok: bool
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self.counters[name] += 1
+            if not ok:
+                self.counters[name + ".failed"] += 1
+            self.histograms[name].append(duration)
+            self._pending.append(Sample(self._clock(), name, duration, bool(ok)))
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time the body of a ``with`` block. An exception leaving the block is recorded as a failure and re-raised
+
+        :param name: What is timed
+        :type name: str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(name, time.perf_counter() - start, ok=False)
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def flush(self):
+        """
+        Append the samples recorded since the last flush to the file. When the file has grown past
+        :data:`MAX_BYTES`, its older half is dropped first
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending or self.path is None:
+            return
+        lines = "".join("{0:.3f} {1} {2:.3f} {3:d}\n".format(sample.time, sample.name, sample.duration * 1000,
+                                                             sample.ok) for sample in pending)
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_BYTES:
+                self._trim()
+            with open(self.path, "a") as file:
+                file.write(lines)
+        except OSError as e:
+            logger.warning("Could not save metrics to %s: %s", self.path, e)
+
+    def _trim(self):
+        with open(self.path) as file:
+            lines = file.readlines()
+        temp_path = "{0}.tmp".format(self.path)
+        with open(temp_path, "w") as file:
+            file.writelines(lines[len(lines) // 2:])
+        os.replace(temp_path, self.path)
+
+
+def read_samples(path, since=None):
+    """
+    :param path: File written by :meth:`Metrics.flush`
+    :type path: :class:`pathlib.Path`
+    :param since: Unix time of the oldest sample to return. All of them if None
+    :type since: float
+    :return: The samples in the file, skipping lines that can't be parsed
+    :rtype: list
+    """
+    samples = []
+    try:
+        with open(path) as file:
+            for line in file:
+                try:
+                    timestamp, name, duration, ok = line.split()
+                    sample = Sample(float(timestamp), name, float(duration) / 1000, ok == "1")
+                except ValueError:
+                    continue
+                if since is None or sample.time >= since:
+                    samples.append(sample)
+    except FileNotFoundError:
+        pass
+    return samples
+
+
+def report(samples):
+    """
+    :param samples: Samples as returned by :func:`read_samples`
+    :type samples: list
+    :return: A table with the number of samples, failures and p50/p95/max latency of each name
+    :rtype: str
+    """
+    if not samples:
+        return "No samples recorded."
+    by_name = collections.defaultdict(list)
+    for sample in samples:
+        by_name[sample.name].append(sample)
+    lines = ["{0:<28}{1:>7}{2:>8}{3:>10}{4:>10}{5:>10}".format("name", "runs", "failed", "p50 ms", "p95 ms",
+                                                               "max ms")]
+    for name, group in sorted(by_name.items()):
+        durations = [sample.duration * 1000 for sample in group]
+        lines.append("{0:<28}{1:>7}{2:>8}{3:>10.1f}{4:>10.1f}{5:>10.1f}".format(
+            name, len(group), sum(not sample.ok for sample in group),
+            percentile(durations, 50), percentile(durations, 95), max(durations)))
+    return "\n".join(lines)
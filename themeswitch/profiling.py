@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Profiles taken with ``themeswitch --profile``.
+
+:class:`Profiler` runs cProfile and tracemalloc around a piece of work and writes a `.prof` file, which can be opened
+with :mod:`pstats` or snakeviz, and a text summary of the lines that allocated the most memory. cProfile only sees
+the thread that started it; the steps of a switch run on worker threads, and their timings are in ``--stats``.
+
+:func:`sample_stacks` samples every thread of a process that is already running, such as the one in the system tray,
+and :func:`write_folded` saves the result in the folded format read by flame graph tools.
+"""
+
+import collections
+import cProfile
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+TOP = 25  # Lines listed in the allocation summary
+SAMPLE_SECONDS = 10  # How long the running instance is sampled
+SAMPLE_INTERVAL = 0.005  # Seconds between two stack samples
+
+
+def profile_path(directory, label, suffix):
+    """
+    :param directory: Directory the profile is written to
+    :type directory: :class:`pathlib.Path`
+    :param label: What is profiled, for example `startup`
+    :type label: str
+    :param suffix: File name ending, for example `.prof`
+    :type suffix: str
+    :return: ``profile-<date>-<time>-<label><suffix>`` in ``directory``
+    :rtype: str
+    """
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(directory, "profile-{0}-{1}{2}".format(stamp, label, suffix))
+
+
+class Profiler:
+    """
+    cProfile and tracemalloc around the body of a ``with`` block, or between :meth:`start` and :meth:`stop`.
+
+    :param directory: Directory the files are written to
+    :type directory: :class:`pathlib.Path`
+    :param label: What is profiled, used in the file names
+    :type label: str
+    :param top: Number of lines listed in the allocation summary
+    :type top: int
+    """
+
+    def __init__(self, directory, label, top=TOP):
+        self.directory = directory
+        self.label = label
+        self.top = top
+        self.stats_path = None
+        self.summary_path = None
+        self._profile = cProfile.Profile()
+        self._started_tracing = False
+        self._start = None
+
+    def start(self):
+        """
+        Start profiling the current thread and tracing allocations
+
+        :return: None
+        :rtype: None
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling and write the `.prof` file and the allocation summary
+
+        :return: Paths to the `.prof` file and to the summary
+        :rtype: tuple
+        """
+        self._profile.disable()
+        duration = time.perf_counter() - self._start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        self.stats_path = profile_path(self.directory, self.label, ".prof")
+        self._profile.dump_stats(self.stats_path)
+        self.summary_path = profile_path(self.directory, self.label, "-allocations.txt")
+        stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+        with open(self.summary_path, "w") as file:
+            file.write("{0}: {1:.3f} s, {2:.1f} KiB allocated, {3:.1f} KiB peak\n".format(
+                self.label, duration, current / 1024, peak / 1024))
+            file.write("Top {0} lines by memory allocated:\n".format(self.top))
+            for stat in stats[:self.top]:
+                file.write("{0}\n".format(stat))
+        logger.info("Profile of %s written to %s and %s", self.label, self.stats_path, self.summary_path)
+        return self.stats_path, self.summary_path
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def sample_stacks(duration=SAMPLE_SECONDS, interval=SAMPLE_INTERVAL):
+    """
+    Sample the stack of every other thread of this process every ``interval`` seconds for ``duration`` seconds
+
+    :param duration: Seconds to sample for
+    :type duration: float
+    :param interval: Seconds between two samples
+    :type interval: float
+    :return: Maps each stack, a tuple ``(thread name, frame, ...)`` from the outermost frame, to the number of times
+        it was seen
+    :rtype: :class:`collections.Counter`
+    """
+    own = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append("{0} ({1}:{2})".format(code.co_name, os.path.basename(code.co_filename),
+                                                     frame.f_lineno))
+                frame = frame.f_back
+            stacks[(names.get(ident, str(ident)),) + tuple(reversed(frames))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def write_folded(path, stacks):
+    """
+    Write stacks as ``thread;outer frame;...;inner frame count`` lines, the most frequent first
+
+    :param path: File to write
+    :type path: str
+    :param stacks: As returned by :func:`sample_stacks`
+    :type stacks: :class:`collections.Counter`
+    :return: None
+    :rtype: None
+    """
+    with open(path, "w") as file:
+        for stack, count in stacks.most_common():
+            file.write("{0} {1}\n".format(";".join(frame.replace(";", ",") for frame in stack), count))
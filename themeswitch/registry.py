@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived handle to the `Personalize` registry key.
+
+:class:`RegistrySession` opens the key once and keeps it open for the life of the process. Both theme values are
+written in one call, and the key is reopened if the handle stops working. Deciding which values need writing is left
+to the caller (see :func:`themeswitch.functions.plan_switch`), so a forced switch writes them all.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RegistrySession:
+    """
+    Open handle to a key under `HKEY_CURRENT_USER`.
+
+    :param winreg: The `winreg` module, or a stand-in with the same interface
+    :type winreg: module
+    :param key_path: Path of the key under `HKEY_CURRENT_USER`
+    :type key_path: str
+    """
+
+    def __init__(self, winreg, key_path):
+        self._winreg = winreg
+        self._key_path = key_path
+        self._key = None
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    def _handle(self):
+        if self._key is None:
+            winreg = self._winreg
+            self._key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, self._key_path, 0,
+                                       winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE)
+            self.opens += 1
+        return self._key
+
+    def _reset(self):
+        if self._key is not None:
+            try:
+                self._winreg.CloseKey(self._key)
+            except OSError:
+                pass
+            self._key = None
+
+    def _call(self, func):
+        with self._lock:
+            try:
+                return func(self._handle())
+            except FileNotFoundError:
+                raise  # The value doesn't exist; the handle is fine
+            except OSError as e:
+                logger.warning("Registry handle failed (%s). Reopening %s.", e, self._key_path)
+                self._reset()
+                return func(self._handle())
+
+    def read(self, name):
+        """
+        :param name: Name of a value of the key
+        :type name: str
+        :raises FileNotFoundError: If the key has no value ``name``
+        :return: The data of the value
+        :rtype: int
+        """
+        return self._call(lambda key: self._winreg.QueryValueEx(key, name)[0])
+
+    def write(self, values):
+        """
+        Set several DWORD values of the key at once
+
+        :param values: Maps value names to their new data
+        :type values: dict
+        :return: None
+        :rtype: None
+        """
+        winreg = self._winreg
+
+        def write(key):
+            for name, value in values.items():
+                winreg.SetValueEx(key, name, 0, winreg.REG_DWORD, value)
+        self._call(write)
+
+    def close(self):
+        """
+        Close the handle. The next read or write opens it again
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._reset()
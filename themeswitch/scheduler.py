@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+In-process scheduler for the resident (GUI/System Tray) instance.
+
+Upcoming transitions are kept in a heap built from the `start_hour`, `start_minute` and `enable_schedule` settings.
+When the `solar` settings are enabled, the times of the next sunrise and sunset are used instead.
+A background thread sleeps until the earliest one and then switches in-process, so a running instance doesn't need
+Task Scheduler to start a new process. The clock can be replaced for testing.
+"""
+
+import datetime
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MODES = ('dark_mode', 'light_mode')
+
+
+def next_occurrence(now, hour, minute):
+    """
+    :param now: Current time
+    :type now: :class:`datetime.datetime`
+    :param hour: Hour of the day
+    :type hour: int
+    :param minute: Minute of the hour
+    :type minute: int
+    :return: The first time after ``now`` at ``hour:minute``
+    :rtype: :class:`datetime.datetime`
+    """
+    deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if deadline <= now:
+        deadline += datetime.timedelta(days=1)
+    return deadline
+
+
+class Scheduler:
+    """
+    Heap of upcoming theme transitions.
+
+    :param action: Callable taking `dark_mode` or `light_mode`, called when a transition is due
+    :type action: callable
+    :param clock: Callable returning the current local time. Defaults to :meth:`datetime.datetime.now`
+    :type clock: callable
+    :param sun: Callable taking ``(latitude, longitude)``, a mode and the current time, and returning the time of the
+        next sunrise (for `light_mode`) or sunset (for `dark_mode`), or None if there is none. Only used when the
+        `solar` settings are enabled; the fixed time of the mode is used when it returns None
+    :type sun: callable
+    """
+
+    def __init__(self, action, clock=datetime.datetime.now, sun=None):
+        self._action = action
+        self._clock = clock
+        self._sun = sun
+        self._heap = []
+        self._times = {}
+        self._location = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._subscribers = []
+
+    def update(self, settings):
+        """
+        Rebuild the heap from the settings. Can be subscribed to the settings store
+
+        :param settings: Dict containing the settings from settings.yaml
+        :type settings: dict
+        :return: None
+        :rtype: None
+        """
+        times = {mode: (int(settings[mode]['start_hour']), int(settings[mode]['start_minute']))
+                 for mode in MODES if settings[mode]['enable_schedule']}
+        solar = settings.get('solar')
+        location = (solar['latitude'], solar['longitude']) if solar and solar['enabled'] else None
+        with self._condition:
+            if times == self._times and location == self._location:
+                return
+            self._times = times
+            self._location = location
+            now = self._clock()
+            self._heap = [(self._next_deadline(now, mode), mode) for mode in times]
+            heapq.heapify(self._heap)
+            self._condition.notify()
+            heap = sorted(self._heap)
+        logger.info("Schedule updated: %s", ", ".join("{0} at {1:%Y-%m-%d %H:%M}".format(mode, deadline)
+                                                       for deadline, mode in heap) or "nothing")
+
+    def _next_deadline(self, now, mode):
+        if self._location is not None and self._sun is not None:
+            try:
+                deadline = self._sun(self._location, mode, now)
+            except Exception:
+                logger.exception("Could not work out the next %s time", "sunrise" if mode == 'light_mode' else "sunset")
+                deadline = None
+            if deadline is not None:
+                return deadline
+        return next_occurrence(now, *self._times[mode])
+
+    def subscribe(self, callback):
+        """
+        Call ``callback`` with the mode after every scheduled switch, on the scheduler thread
+
+        :param callback: Callable taking `dark_mode` or `light_mode`
+        :type callback: callable
+        :return: None
+        :rtype: None
+        """
+        self._subscribers.append(callback)
+
+    def handles(self, mode):
+        """
+        :param mode: `dark_mode` or `light_mode`
+        :type mode: str
+        :return: True if the scheduler thread is running and switches to ``mode`` at its scheduled time
+        :rtype: bool
+        """
+        with self._condition:
+            return self._thread is not None and mode in self._times
+
+    def next_transition(self):
+        """
+        :return: ``(deadline, mode)`` of the next transition, or None if nothing is scheduled
+        :rtype: tuple
+        """
+        with self._condition:
+            return self._heap[0] if self._heap else None
+
+    def run_pending(self):
+        """
+        Run the transition that is due, if any. When several are due (for example after the computer was asleep)
+        only the most recent one is run, and every due transition is rescheduled for its next day
+
+        :return: The mode that was applied, or None
+        :rtype: str
+        """
+        with self._condition:
+            now = self._clock()
+            due = None
+            while self._heap and self._heap[0][0] <= now:
+                deadline, mode = heapq.heappop(self._heap)
+                due = mode
+                heapq.heappush(self._heap, (self._next_deadline(now, mode), mode))
+        if due is not None:
+            logger.info("Scheduled switch to %s", due)
+            try:
+                self._action(due)
+            except Exception:
+                logger.exception("Scheduled switch to %s failed", due)
+            for callback in list(self._subscribers):
+                callback(due)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = (self._heap[0][0] - self._clock()).total_seconds()
+                if delay > 0:
+                    # Wake up at least once a minute, so clock changes and resuming from sleep are noticed
+                    self._condition.wait(min(delay, 60))
+                    continue
+            self.run_pending()
+
+    def wake(self):
+        """
+        Make the scheduler thread check the clock now
+
+        :return: None
+        :rtype: None
+        """
+        with self._condition:
+            self._condition.notify()
+
+    def start(self):
+        """
+        Start the scheduler thread. Calling this more than once has no effect
+
+        :return: None
+        :rtype: None
+        """
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the scheduler thread
+
+        :return: None
+        :rtype: None
+        """
+        with self._condition:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory cache of `settings.yaml`.
+
+The file is parsed and validated once. Later reads only compare the file's modification time and size with the ones
+seen at the last parse, and reparse when they differ. Subscribers are notified whenever new settings are loaded.
+
+Writes go to a temporary file that then replaces `settings.yaml`, so a crash never leaves a truncated file behind.
+:class:`SettingsWriter` coalesces bursts of edits into a single write.
+"""
+
+import copy
+import logging
+import os
+import tempfile
+import threading
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsStore:
+    """
+    Cached, validated view of a settings file.
+
+    :param path: Path to `settings.yaml`
+    :type path: :class:`pathlib.Path`
+    :param defaults: Callable returning the settings written when the file is missing or invalid
+    :type defaults: callable
+    :param validate: Callable returning True if the parsed settings can be used
+    :type validate: callable
+    """
+
+    def __init__(self, path, defaults, validate):
+        self.path = path
+        self._defaults = defaults
+        self._validate = validate
+        self._settings = None
+        self._text = None
+        self._signature = None
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.parses = 0
+        self.writes = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _write(self, text):
+        fd, temp_path = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._text = text
+        self.writes += 1
+
+    def _load(self):
+        """Parse the file. Returns None if it's missing or invalid."""
+        logger.info("Attempting to read settings file")
+        try:
+            with open(self.path) as file:
+                text = file.read()
+            settings = yaml.load(text, Loader=yaml.FullLoader)
+        except FileNotFoundError:
+            return None
+        except yaml.YAMLError as e:
+            logger.warning("Settings file %s can't be parsed: %s", self.path, e)
+            return None
+        self.parses += 1
+        if not self._validate(settings):
+            return None
+        self._text = text
+        logger.info("Settings recovered successfully")
+        return settings
+
+    def refresh(self):
+        """
+        Reparse the file if it changed since it was last read, and notify subscribers if it did.
+        If the file is missing or invalid the first time it's read, it's replaced with the defaults. Later, for example
+        while it's being edited outside the program, the last valid settings are kept and the file is left alone
+
+        :return: True if new settings were loaded
+        :rtype: bool
+        """
+        with self._lock:
+            signature = self._stat()
+            if self._settings is not None and signature == self._signature:
+                return False
+            settings = self._load()
+            if settings is None:
+                if self._settings is not None:
+                    logger.warning("Settings file %s is missing or invalid, keeping the last valid settings",
+                                   self.path)
+                    self._signature = signature
+                    return False
+                settings = self._defaults()
+                self._write(yaml.dump(settings))
+                logger.info("New settings file with default values created in %s", self.path)
+            self._settings = settings
+            self._signature = self._stat()
+        self._notify()
+        return True
+
+    def _notify(self):
+        with self._lock:
+            settings = copy.deepcopy(self._settings)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(settings)
+            except Exception:
+                logger.exception("Settings subscriber %r failed", callback)
+
+    def save(self, settings):
+        """
+        Atomically replace the settings file with ``settings``. Nothing is written if the file already has the same
+        content.
+
+        :param settings: The new settings
+        :type settings: dict
+        :raises ValueError: If ``settings`` don't pass validation
+        :return: True if the file was written
+        :rtype: bool
+        """
+        text = yaml.dump(settings)
+        if not self._validate(yaml.load(text, Loader=yaml.FullLoader)):
+            raise ValueError("Invalid settings: {0!r}".format(settings))
+        with self._lock:
+            self.refresh()
+            if text == self._text:
+                return False
+            self._write(text)
+            self._settings = copy.deepcopy(settings)
+            self._signature = self._stat()
+        logger.info("Settings saved to %s", self.path)
+        self._notify()
+        return True
+
+    def get(self):
+        """
+        :return: A copy of the current settings. The file is only reparsed if it changed
+        :rtype: dict
+        """
+        self.refresh()
+        with self._lock:
+            return copy.deepcopy(self._settings)
+
+    def subscribe(self, callback):
+        """
+        Call ``callback`` with a copy of the new settings every time they are reloaded
+
+        :param callback: Callable taking the settings dictionary. It may be called from any thread
+        :type callback: callable
+        :return: A callable that removes the subscription
+        :rtype: callable
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def watch(self, interval=2.0):
+        """
+        Check the file for changes every ``interval`` seconds on a background thread, so subscribers are notified of
+        changes made outside the program. Calling this more than once has no effect.
+
+        :param interval: Seconds between checks
+        :type interval: float
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name="settings-watcher",
+                                             daemon=True)
+            self._watcher.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.refresh()
+
+    def stop(self):
+        """
+        Stop the thread started by :meth:`watch`
+
+        :return: None
+        :rtype: None
+        """
+        self._stop.set()
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.join()
+
+
+class SettingsWriter:
+    """
+    Debounced writer for a :class:`SettingsStore`. Every call to :meth:`update` replaces the pending settings and
+    restarts the countdown; the store is only written once no edit has arrived for ``delay`` seconds.
+
+    :param store: The store to write to
+    :type store: :class:`SettingsStore`
+    :param delay: Seconds to wait after the last edit before writing
+    :type delay: float
+    """
+
+    def __init__(self, store, delay=0.5):
+        self._store = store
+        self._delay = delay
+        self._pending = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def update(self, settings):
+        """
+        Schedule ``settings`` to be written
+
+        :param settings: The new settings
+        :type settings: dict
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._pending = copy.deepcopy(settings)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self._delay, self._scheduled_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _scheduled_flush(self):
+        try:
+            self.flush()
+        except (OSError, ValueError):
+            logger.exception("Could not save settings")
+
+    def flush(self):
+        """
+        Write the pending settings now, if there are any
+
+        :raises ValueError: If the pending settings don't pass validation
+        :return: True if the file was written
+        :rtype: bool
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending is None:
+            return False
+        return self._store.save(pending)
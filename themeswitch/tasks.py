@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Task Scheduler reconciliation.
+
+The whole `Theme Switch` folder is read with a single `SCHTASKS /QUERY`, compared against the settings in one pass,
+and every correction is sent to the shell as one batch, so a startup costs at most two processes.
+"""
+
+import csv
+import re
+from collections import namedtuple
+from pathlib import Path
+
+TASK_FOLDER = "Theme Switch"
+TASK_NAMES = {'dark_mode': "Change to Dark Mode", 'light_mode': "Change to Light Mode"}
+# --scheduled makes the task do nothing while the program is running, since it switches at these times itself
+TASK_FLAGS = {'dark_mode': "-d --scheduled", 'light_mode': "-l --scheduled"}
+TSWITCH_EXE = Path(__file__).parent / r"..\TSwitch.exe"
+
+TaskState = namedtuple('TaskState', ['name', 'start_time', 'enabled'])
+
+_time = re.compile(r'(\d{1,2}):(\d{2})(?::\d{2})?\s*([AaPp][Mm])?\s*$')
+
+
+def create_command(mode, start_time):
+    """
+    :param mode: `dark_mode` or `light_mode`
+    :type mode: str
+    :param start_time: Daily start time in a 24 hours format `HH:MM`
+    :type start_time: str
+    :return: The `SCHTASKS` command line that creates (or replaces) the task for ``mode``
+    :rtype: str
+    """
+    return r'SCHTASKS /CREATE /SC DAILY /TN "{0}\{1}" /TR "{2} {3}" /ST {4} /F'.format(
+        TASK_FOLDER, TASK_NAMES[mode], TSWITCH_EXE, TASK_FLAGS[mode], start_time)
+
+
+def change_command(mode, state):
+    """
+    :param mode: `dark_mode` or `light_mode`
+    :type mode: str
+    :param state: `ENABLE` or `DISABLE`
+    :type state: str
+    :return: The `SCHTASKS` command line that enables or disables the task for ``mode``
+    :rtype: str
+    """
+    return r'SCHTASKS /CHANGE /TN "{0}\{1}" /{2}'.format(TASK_FOLDER, TASK_NAMES[mode], state)
+
+
+def query_command():
+    """
+    :return: The `SCHTASKS` command line that lists every task in the `Theme Switch` folder as CSV
+    :rtype: str
+    """
+    return r'SCHTASKS /QUERY /TN "\{0}\" /FO CSV /NH 2>NUL'.format(TASK_FOLDER)
+
+
+def parse_time(next_run_time):
+    """
+    Extract the time of day from the `Next Run Time` column of `SCHTASKS /QUERY`
+
+    :param next_run_time: For example `"18/10/2026 19:00:00"`, `"10/18/2026 7:00:00 PM"` or `"N/A"`
+    :type next_run_time: str
+    :return: The time in a 24 hours format `HH:MM`, or None if the task has no next run time
+    :rtype: str
+    """
+    match = _time.search(next_run_time.strip())
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), match.group(2), match.group(3)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.upper() == "PM" else 0)
+    return "{0:02d}:{1}".format(hour, minute)
+
+
+def parse_query(output):
+    """
+    Parse the CSV output of :func:`query_command` into a snapshot of the folder
+
+    :param output: What `SCHTASKS /QUERY /FO CSV /NH` printed
+    :type output: str
+    :return: Maps lowercase task names to :class:`TaskState` tuples
+    :rtype: dict
+    """
+    snapshot = {}
+    for row in csv.reader(output.splitlines()):
+        if len(row) < 3 or not row[0].strip():
+            continue
+        name = row[0].strip().rsplit("\\", 1)[-1]
+        status = row[-1].strip()
+        snapshot[name.lower()] = TaskState(name, parse_time(row[-2]), status != "Disabled")
+    return snapshot
+
+
+def plan(settings, snapshot):
+    """
+    Compare the settings with a snapshot of Task Scheduler and return the commands needed to make them match.
+    A task that doesn't exist is only created if its schedule is enabled, so nothing is done until the user has
+    enabled scheduling at least once.
+
+    :param settings: Dict containing the settings from settings.yaml
+    :type settings: dict
+    :param snapshot: Snapshot returned by :func:`parse_query`
+    :type snapshot: dict
+    :return: A list of ``(command, description)`` tuples
+    :rtype: list
+    """
+    corrections = []
+    for mode, task_name in TASK_NAMES.items():
+        wanted = settings[mode]['enable_schedule']
+        start_time = "{0}:{1}".format(settings[mode]['start_hour'], settings[mode]['start_minute'])
+        task = snapshot.get(task_name.lower())
+        if task is None:
+            if wanted:
+                corrections.append((create_command(mode, start_time),
+                                    "Task {0} did not exist and has been created at {1}".format(task_name, start_time)))
+        elif wanted and (not task.enabled or task.start_time != start_time):
+            # A disabled task has no next run time to compare against. Creating it again enables it and fixes its
+            # start time with a single command.
+            corrections.append((create_command(mode, start_time),
+                                "Task {0} has been corrected to run at {1}".format(task_name, start_time)))
+        elif not wanted and task.enabled:
+            corrections.append((change_command(mode, "DISABLE"),
+                                "Task {0} status has been corrected to DISABLE".format(task_name)))
+    return corrections
+
+
+def reconcile(settings, run_command):
+    """
+    Bring Task Scheduler in line with the settings using one query and at most one batch of corrections
+
+    :param settings: Dict containing the settings from settings.yaml
+    :type settings: dict
+    :param run_command: Callable that runs a shell command line and returns its output, for example
+        :meth:`themeswitch.backend.Backend.run_command`
+    :type run_command: callable
+    :return: Descriptions of the corrections that were applied
+    :rtype: list
+    """
+    corrections = plan(settings, parse_query(run_command(query_command())))
+    if corrections:
+        run_command(" & ".join(command for command, _ in corrections))
+    return [description for _, description in corrections]
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Cached view of the theme values in the `Personalize` registry key.
+
+:class:`ThemeState` reads each value once and keeps it until a notifier reports that the key changed. On Windows the
+notification comes from `RegNotifyChangeKeyValue`; where that isn't available a :class:`PollingNotifier` compares
+the values at a short interval instead. Asking for the current theme is then free.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+
+
+class ThemeState:
+    """
+    Cache of theme DWORDs that is cleared by ``notifier``.
+
+    :param read: Callable taking a value name and returning its current value, for example
+        :meth:`themeswitch.backend.Backend.read_theme`
+    :type read: callable
+    :param notifier: Object with a ``start(callback)`` method that calls ``callback`` whenever the key changes
+    :type notifier: object
+    """
+
+    def __init__(self, read, notifier):
+        self._read = read
+        self._values = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.notifier = notifier
+        notifier.start(self.invalidate)
+
+    def get(self, name):
+        """
+        :param name: `AppsUseLightTheme` or `SystemUsesLightTheme`
+        :type name: str
+        :return: The cached value, read from the registry only if the key changed since it was last read
+        :rtype: int
+        """
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+            generation = self._generation
+        value = self._read(name)
+        with self._lock:
+            if generation == self._generation:  # Don't cache a value that a notification made stale meanwhile
+                self._values[name] = value
+        return value
+
+    def set(self, name, value):
+        """
+        Record a value the program itself has just written
+
+        :param name: `AppsUseLightTheme` or `SystemUsesLightTheme`
+        :type name: str
+        :param value: The value written
+        :type value: int
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._values[name] = value
+
+    def invalidate(self):
+        """
+        Forget every cached value
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
+
+
+class RegistryNotifier:
+    """
+    Waits for changes to a registry key on a background thread with `RegNotifyChangeKeyValue`. If the notification
+    can't be set up, it falls back to ``fallback``.
+
+    :param winreg: The `winreg` module
+    :type winreg: module
+    :param ctypes: The `ctypes` module
+    :type ctypes: module
+    :param key_path: Key under `HKEY_CURRENT_USER` to watch
+    :type key_path: str
+    :param fallback: Notifier started instead if the registry can't be watched
+    :type fallback: object
+    """
+
+    def __init__(self, winreg, ctypes, key_path, fallback):
+        self._winreg = winreg
+        self._ctypes = ctypes
+        self._key_path = key_path
+        self._fallback = fallback
+
+    def start(self, callback):
+        threading.Thread(target=self._run, args=(callback,), name="theme-notifier", daemon=True).start()
+
+    def _run(self, callback):
+        winreg, ctypes = self._winreg, self._ctypes
+        notify = ctypes.windll.advapi32.RegNotifyChangeKeyValue
+        notify.argtypes = [ctypes.c_void_p, ctypes.c_bool, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_bool]
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self._key_path, 0, winreg.KEY_NOTIFY) as key:
+                while True:
+                    # Blocks until a value of the key is set
+                    error = notify(key.handle, False, REG_NOTIFY_CHANGE_LAST_SET, None, False)
+                    if error:
+                        raise OSError(error, "RegNotifyChangeKeyValue failed")
+                    callback()
+        except OSError as e:
+            logger.warning("Can't watch the registry for theme changes (%s). Polling instead.", e)
+            callback()
+            self._fallback.start(callback)
+
+
+class PollingNotifier:
+    """
+    Reads the watched values every ``interval`` seconds on a background thread and reports when any of them changed.
+
+    :param read: Callable taking a value name and returning its current value
+    :type read: callable
+    :param names: Names of the values to watch
+    :type names: tuple
+    :param interval: Seconds between reads
+    :type interval: float
+    """
+
+    def __init__(self, read, names, interval=1.0):
+        self._read = read
+        self._names = names
+        self._interval = interval
+        self._stop = threading.Event()
+
+    def _snapshot(self):
+        try:
+            return tuple(self._read(name) for name in self._names)
+        except OSError:
+            return None
+
+    def start(self, callback):
+        threading.Thread(target=self._run, args=(callback,), name="theme-poller", daemon=True).start()
+
+    def _run(self, callback):
+        last = self._snapshot()
+        while not self._stop.wait(self._interval):
+            current = self._snapshot()
+            if current != last:
+                last = current
+                callback()
+
+    def stop(self):
+        self._stop.set()
+
+
+class FakeNotifier:
+    """
+    Notifier for tests. :meth:`fire` simulates a change to the registry key.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+
+    def start(self, callback):
+        self._callbacks.append(callback)
+
+    def fire(self):
+        for callback in self._callbacks:
+            callback()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Wallpaper previews for the Settings dialog.
+
+Thumbnails are decoded at reduced size (JPEG draft mode) and kept on disk, keyed by the source path, modification time
+and file size, so opening the dialog again doesn't decode the full wallpaper. The least recently used thumbnails are
+evicted once the cache holds more than ``max_entries``.
+"""
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+PREVIEW_SIZE = (128, 96)
+
+
+def image_size(path):
+    """
+    Read the dimensions of an image from its header, without decoding the pixels
+
+    :param path: Path to the image
+    :type path: str
+    :raises OSError: If the file can't be opened or isn't an image
+    :return: ``(width, height)`` in pixels
+    :rtype: tuple
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+class ThumbnailCache:
+    """
+    Persistent LRU cache of wallpaper thumbnails.
+
+    :param directory: Directory where thumbnails are stored. Created on first use
+    :type directory: :class:`pathlib.Path`
+    :param max_entries: Number of thumbnails kept on disk
+    :type max_entries: int
+    """
+
+    def __init__(self, directory, max_entries=32):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.decodes = 0
+
+    def entry_path(self, path, size=PREVIEW_SIZE):
+        """
+        :param path: Path to the source image
+        :type path: str
+        :param size: Maximum thumbnail ``(width, height)``
+        :type size: tuple
+        :return: Where the thumbnail of the current version of ``path`` is stored
+        :rtype: :class:`pathlib.Path`
+        """
+        st = os.stat(path)
+        key = "{0}|{1}|{2}|{3}x{4}".format(os.path.abspath(path), st.st_mtime_ns, st.st_size, *size)
+        return self.directory / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    def get(self, path, size=PREVIEW_SIZE):
+        """
+        Return a thumbnail of ``path`` that fits in ``size``
+
+        :param path: Path to the source image
+        :type path: str
+        :param size: Maximum thumbnail ``(width, height)``
+        :type size: tuple
+        :raises OSError: If the source image can't be read or decoded
+        :return: The thumbnail
+        :rtype: :class:`PIL.Image.Image`
+        """
+        from PIL import Image
+
+        with self._lock:
+            entry = self.entry_path(path, size)
+            try:
+                thumbnail = Image.open(entry)
+                thumbnail.load()
+                os.utime(entry)  # Mark as recently used
+                return thumbnail
+            except OSError:
+                pass
+            with Image.open(path) as img:
+                img.draft("RGB", size)
+                img.thumbnail(size)
+                thumbnail = img.convert("RGB")
+            self.decodes += 1
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp = entry.with_name(entry.name + ".tmp")
+            thumbnail.save(temp, "PNG")
+            os.replace(temp, entry)
+            self._evict()
+            return thumbnail
+
+    def _evict(self):
+        entries = sorted(self.directory.glob("*.png"), key=lambda p: p.stat().st_mtime_ns)
+        for entry in entries[:max(0, len(entries) - self.max_entries)]:
+            entry.unlink()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of wallpapers pre-fitted to the screen.
+
+Windows decodes and rescales the wallpaper every time it is set. :class:`WallpaperCache` does that work once per image
+and screen resolution, cropping and resizing the image the same way the `Fill` wallpaper style does, and keeps the
+result so the operating system is always handed a file that already has the size of the screen.
+
+Rendered files are named after the SHA-1 of the source image and the target size. An index remembers the hash of each
+source path together with its modification time and size, so a cache hit costs one `stat` and no hashing or decoding.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+INDEX_FILE = "index.json"
+RENDER_FORMAT = "JPEG"
+RENDER_QUALITY = 95
+
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render(source, target, size):
+    """
+    Crop and resize ``source`` to exactly ``size`` and save it to ``target``
+
+    :param source: Path to the original image
+    :type source: str
+    :param target: Path of the file to create
+    :type target: :class:`pathlib.Path`
+    :param size: Target ``(width, height)`` in pixels
+    :type size: tuple
+    :return: None
+    :rtype: None
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img.draft("RGB", size)  # Let the JPEG decoder skip detail that would be thrown away anyway
+        fitted = ImageOps.fit(img.convert("RGB"), size, Image.LANCZOS)
+    temp = target.with_name(target.name + ".tmp")
+    fitted.save(temp, RENDER_FORMAT, quality=RENDER_QUALITY)
+    os.replace(temp, target)
+
+
+class WallpaperCache:
+    """
+    Content-addressed cache of pre-fitted wallpapers.
+
+    :param directory: Directory where rendered wallpapers and the index are stored. Created on first use
+    :type directory: :class:`pathlib.Path`
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._index = None
+        self._lock = threading.Lock()
+        self.renders = 0
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.directory / INDEX_FILE) as file:
+                    self._index = json.load(file)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp = self.directory / (INDEX_FILE + ".tmp")
+        with open(temp, "w") as file:
+            json.dump(self._index, file)
+        os.replace(temp, self.directory / INDEX_FILE)
+
+    def _source_hash(self, source):
+        st = os.stat(source)
+        index = self._load_index()
+        entry = index.get(source)
+        if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return entry['sha1']
+        sha1 = _sha1(source)
+        index[source] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'sha1': sha1}
+        self._save_index()
+        return sha1
+
+    def entry_path(self, sha1, size):
+        """
+        :param sha1: SHA-1 of the source image
+        :type sha1: str
+        :param size: Target ``(width, height)`` in pixels
+        :type size: tuple
+        :return: Where the source image rendered at ``size`` is stored
+        :rtype: :class:`pathlib.Path`
+        """
+        return self.directory / "{0}-{1}x{2}.jpg".format(sha1, *size)
+
+    def prepare(self, source, size):
+        """
+        Return a copy of ``source`` fitted to ``size``, rendering it if it isn't cached yet
+
+        :param source: Path to the original image
+        :type source: str
+        :param size: Screen ``(width, height)`` in pixels
+        :type size: tuple
+        :raises OSError: If the source image can't be read or decoded
+        :return: Path to the pre-fitted image
+        :rtype: :class:`pathlib.Path`
+        """
+        with self._lock:
+            target = self.entry_path(self._source_hash(source), size)
+            if not target.exists():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                render(source, target, size)
+                self.renders += 1
+            return target
+
+    def evict(self, sources, size):
+        """
+        Delete everything that isn't one of ``sources`` rendered at ``size``
+
+        :param sources: Paths of the wallpapers currently in use
+        :type sources: list
+        :param size: Current screen ``(width, height)`` in pixels
+        :type size: tuple
+        :return: Number of files deleted
+        :rtype: int
+        """
+        with self._lock:
+            index = self._load_index()
+            for source in list(index):
+                if source not in sources:
+                    del index[source]
+            keep = {self.entry_path(entry['sha1'], size).name for entry in index.values()}
+            removed = 0
+            if self.directory.exists():
+                for path in self.directory.glob("*.jpg"):
+                    if path.name not in keep:
+                        path.unlink()
+                        removed += 1
+                self._save_index()
+            return removed
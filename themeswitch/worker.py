@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Queue of switch requests.
+
+Requests from the tray menu, forwarded commands and the scheduler all run on one dedicated thread, one at a time, so
+two switches never interleave and whoever asked for a switch doesn't wait for it. A request that is already queued
+or running is not added again: asking twice for the same switch while it's in progress results in one switch.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SwitchQueue:
+    """
+    Runs requests one at a time on a worker thread, collapsing duplicates.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="switch-queue")
+        self._active = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *args):
+        """
+        Queue ``func(*args)``, unless a request with the same ``key`` is queued or running already
+
+        :param key: Identifies the request, for example `dark_mode` or `toggle`
+        :type key: str
+        :param func: Callable to run
+        :type func: callable
+        :return: The future of the request, shared by the duplicates collapsed into it
+        :rtype: :class:`concurrent.futures.Future`
+        """
+        with self._lock:
+            future = self._active.get(key)
+            if future is not None:
+                logger.info("Switch request '%s' is already in progress", key)
+                return future
+            future = self._executor.submit(func, *args)
+            self._active[key] = future
+        future.add_done_callback(lambda future: self._done(key, future))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._active.get(key) is future:
+                del self._active[key]
+            subscribers = list(self._subscribers)
+        if future.exception() is not None:
+            logger.error("Switch request '%s' failed: %r", key, future.exception())
+        for callback in subscribers:
+            try:
+                callback(key, future)
+            except Exception:
+                logger.exception("Switch subscriber failed")
+
+    def subscribe(self, callback):
+        """
+        Call ``callback`` with the key and the future of every request once it's done, on the worker thread
+
+        :param callback: Callable taking the key and the :class:`concurrent.futures.Future`
+        :type callback: callable
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def in_progress(self):
+        """
+        :return: Keys of the requests queued or running
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._active)